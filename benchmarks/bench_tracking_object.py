@@ -0,0 +1,245 @@
+# bench_tracking_object.py
+# Microbenchmark and correctness check of the per tag, per frame hot path
+# (TrackingObject._get_state, add_timestep and _smooth_missed_frames) driven
+# through Tracking.save_detections with generated detections
+#
+# Usage:
+#   python benchmarks/bench_tracking_object.py                     compare against baseline
+#   python benchmarks/bench_tracking_object.py --update-baseline   store new baseline
+#
+# Timings are machine specific; update the baseline when running on a new machine
+# before measuring a change.
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from smarticletracking.tracking import Tracking
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# (name, number of tags, number of frames, probability a gap starts in a frame, max gap length)
+SCENARIOS = [
+    ('1k_tags', 1000, 200, 0.02, 30),
+    ('5k_tags', 5000, 40, 0.02, 30),
+    ('long_gaps', 200, 1000, 0.01, 60),
+]
+
+# frame period of generated detections (s)
+DT = 1./30
+# half side length of tags (pixels)
+HALF_SIDE = 8.
+# tolerance of states compared to ground truth
+TOLERANCE = 1e-6
+# allowed bytes and blocks retained per frame and tag, which are 0 in steady state; a leak
+# retains at least one block of 16 bytes per tag-update
+RETAINED_SLACK = {'retained_bytes_per_frame': 1., 'blocks_per_frame': 0.01}
+
+
+def generate(n_tags, n_frames, gap_rate, max_gap, seed=0):
+    '''
+    Generates ground truth states of tags moving at constant velocity and angular
+    velocity (so linear interpolation over missed frames is exact and theta wraps
+    around many times), detection mask with gaps, and per frame lists of detection
+    dicts in the format of the apriltag binding ('id', 'center', 'lb-rb-rt-lt')
+    '''
+    rng = np.random.default_rng(seed)
+    k = np.arange(n_frames)[:,None]
+    x0 = rng.uniform(0, 1920, (n_tags, 2))
+    v = rng.uniform(-2, 2, (n_tags, 2))
+    theta0 = rng.uniform(-np.pi+0.01, np.pi-0.01, n_tags)
+    # fast enough to wrap often, slow enough that a gap never hides more than half a turn
+    omega = rng.choice([-1, 1], n_tags)*rng.uniform(0.5, 0.9, n_tags)*np.pi/(max_gap+1)
+    xy = x0+k[:,:,None]*v
+    theta = theta0+k*omega
+    truth = np.concatenate([xy, theta[:,:,None]], axis=2)
+
+    detected = np.ones((n_frames, n_tags), dtype=bool)
+    starts = np.argwhere(rng.random((n_frames, n_tags)) < gap_rate)
+    lengths = rng.integers(1, max_gap+1, len(starts))
+    for (f, i), length in zip(starts, lengths):
+        detected[f:f+length, i] = False
+    # overlapping gaps are split so no gap is longer than max_gap, and tags are always
+    # detected in first and last frame so all gaps are interpolated
+    detected[::max_gap+1] = True
+    detected[-1] = True
+
+    u = np.stack([np.cos(theta), np.sin(theta)], axis=2)*HALF_SIDE
+    w = np.stack([-u[...,1], u[...,0]], axis=2)
+    # corners lb, rb, rt, lt; top edge is in direction of theta
+    corners = np.stack([xy-u-w, xy-u+w, xy+u+w, xy+u-w], axis=2)
+    ids = np.arange(n_tags)
+    frames = [[{'id': int(i), 'center': xy[f,i].copy(), 'lb-rb-rt-lt': corners[f,i].copy()}\
+        for i in ids[detected[f]]] for f in range(n_frames)]
+    return truth, detected, frames
+
+
+def replay(n_tags, frames):
+    '''
+    Replays detections through Tracking.save_detections, returns tracking and time (ns) spent
+    in save_detections
+    '''
+    track = Tracking(list(range(n_tags)))
+    track.t0 = 0.
+    for obj, det in zip(track.tracking_objects, frames[0]):
+        obj.init_detection(0., det)
+
+    t_total = 0
+    # garbage collection pauses are the largest source of noise (as in timeit)
+    gc.disable()
+    try:
+        for f in range(1, len(frames)):
+            t_start = time.perf_counter_ns()
+            track.save_detections(frames[f], t_capture=f*DT, seq=f)
+            t_total += time.perf_counter_ns()-t_start
+    finally:
+        gc.enable()
+    return track, t_total
+
+
+def measure_allocations(n_tags, frames, max_gap):
+    '''
+    Replays detections cyclically with a history bounded to twice the longest gap, and measures
+    one full cycle of frames once the history is full. Tags are detected in the first and last
+    frame, so no gap spans the wrap around and the cycle is stationary: in steady state every
+    frame frees the states it evicts from the history, so nothing is retained over the cycle.
+    Returns mean peak traced bytes allocated during a frame, and bytes and blocks retained per
+    frame over the cycle
+    '''
+    history_len = 2*(max_gap+1)
+    track = Tracking(list(range(n_tags)), history_len=history_len)
+    track.t0 = 0.
+    for obj, det in zip(track.tracking_objects, frames[0]):
+        obj.init_detection(0., det)
+
+    n = len(frames)
+    # start of measured cycle, one cycle after the history is full
+    start = n*(history_len//n+2)
+    peak = 0
+    tracemalloc.start()
+    for f in range(1, start):
+        track.save_detections(frames[f % n], t_capture=f*DT, seq=f)
+    # collection of garbage left from the warmup would show as negative retained memory
+    gc.collect()
+    gc.disable()
+    current_start = tracemalloc.get_traced_memory()[0]
+    blocks_start = sys.getallocatedblocks()
+    for f in range(start, start+n):
+        frame_start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        track.save_detections(frames[f % n], t_capture=f*DT, seq=f)
+        peak += tracemalloc.get_traced_memory()[1]-frame_start
+    # retained memory is measured over the whole cycle, per frame differences would include
+    # the bookkeeping of this loop
+    retained = tracemalloc.get_traced_memory()[0]-current_start
+    blocks = sys.getallocatedblocks()-blocks_start
+    gc.enable()
+    tracemalloc.stop()
+    return peak/n, retained/n, blocks/n
+
+
+def check(track, truth, detected):
+    '''
+    Returns max errors of detected and interpolated states compared to ground truth
+    '''
+    t, X, mask = track.get_trajectory()
+    assert np.allclose(t, np.arange(len(t))*DT), 'timestamps do not match frame times'
+    assert np.array_equal(mask, detected), 'detection mask does not match'
+    error = np.abs(X-truth).max(axis=2)
+    return error[detected].max(), error[~detected].max() if np.any(~detected) else 0.
+
+
+def run_scenario(name, n_tags, n_frames, gap_rate, max_gap, repeats):
+    truth, detected, frames = generate(n_tags, n_frames, gap_rate, max_gap)
+    updates = n_tags*(n_frames-1)
+    ns = []
+    for _ in range(repeats):
+        track, t_total = replay(n_tags, frames)
+        ns.append(t_total/updates)
+    median = float(np.median(ns))
+    detected_error, interpolated_error = check(track, truth, detected)
+    # allocations are measured in a separate run, tracing slows down the hot path
+    peak, retained, blocks = measure_allocations(n_tags, frames, max_gap)
+    result = {
+        'ns_per_tag_update': median,
+        # relative spread of repeats, the timing noise of this machine
+        'ns_spread': (max(ns)-min(ns))/median,
+        'peak_bytes_per_frame': peak,
+        'retained_bytes_per_frame': retained,
+        'blocks_per_frame': blocks,
+        'missed_fraction': 1.-detected.mean(),
+        'max_error_detected': detected_error,
+        'max_error_interpolated': interpolated_error,
+    }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark TrackingObject state and interpolation hot path')
+    parser.add_argument('--update-baseline', action='store_true', help='store results as new baseline')
+    parser.add_argument('--repeats', type=int, default=5, help='timing repeats, median is reported')
+    # medians of separate runs on a shared machine differ by up to ~1.45x, more than the spread
+    # of repeats within a run
+    parser.add_argument('--tolerance', type=float, default=1.5,\
+        help='fail if ns per tag-update (or peak bytes per frame) exceed baseline by this factor; '\
+        'for time it is widened to the spread of repeats when timing is noisier than that')
+    parser.add_argument('--scenario', action='append', help='only run named scenarios')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = False
+    for name, n_tags, n_frames, gap_rate, max_gap in SCENARIOS:
+        if args.scenario and name not in args.scenario:
+            continue
+        r = run_scenario(name, n_tags, n_frames, gap_rate, max_gap, args.repeats)
+        results[name] = r
+        line = '{:10s} {:5d} tags x {:4d} frames ({:4.1%} missed): {:8.0f} ns/tag-update (spread {:3.0%}), '\
+            '{:10.0f} peak B/frame, {:6.1f} retained B/frame, {:5.2f} blocks/frame, '\
+            'max error {:.1e} / {:.1e} (interpolated)'.format(\
+            name, n_tags, n_frames, r['missed_fraction'], r['ns_per_tag_update'], r['ns_spread'],\
+            r['peak_bytes_per_frame'], r['retained_bytes_per_frame'], r['blocks_per_frame'],\
+            r['max_error_detected'], r['max_error_interpolated'])
+        regressions = []
+        if r['max_error_detected'] > TOLERANCE or r['max_error_interpolated'] > TOLERANCE:
+            line += '  INCORRECT'
+            failed = True
+        # nothing is retained in steady state, independent of baseline
+        for key, slack in RETAINED_SLACK.items():
+            if abs(r[key]) > slack*n_tags:
+                regressions.append(key.replace('_per_frame', '').replace('_', ' '))
+        if name in baseline and not args.update_baseline:
+            base = baseline[name]
+            ratio = r['ns_per_tag_update']/base['ns_per_tag_update']
+            line += '  {:.2f}x baseline'.format(ratio)
+            time_tolerance = max(args.tolerance, 1.+base.get('ns_spread', 0.), 1.+r['ns_spread'])
+            if ratio > time_tolerance:
+                regressions.append('time')
+            if r['peak_bytes_per_frame'] > args.tolerance*base.get('peak_bytes_per_frame', np.inf):
+                regressions.append('peak bytes')
+        if regressions:
+            line += '  REGRESSION ({})'.format(', '.join(regressions))
+            failed = True
+        print(line)
+
+    if args.update_baseline:
+        baseline.update({name: {key: r[key] for key in ('ns_per_tag_update', 'ns_spread',\
+            'peak_bytes_per_frame')} for name, r in results.items()})
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print('Baseline written to {}'.format(BASELINE_PATH))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
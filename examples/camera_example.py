@@ -1,8 +1,5 @@
-import sys
-sys.path.append("../src")
-
 import cv2
-from camera import Camera
+from smarticletracking.camera import Camera
 
 
 # Live camera feed or prerecorded video
@@ -1,12 +1,6 @@
-
-import sys
-sys.path.append("../src")
-
-
-
 import cv2
-from tracking import Tracking
-from camera import Camera
+from smarticletracking.tracking import Tracking
+from smarticletracking.camera import Camera
 import time
 
 # constants
@@ -25,17 +19,21 @@ def step_function(camera, tracking, smart_ids, ring_ids, side_length):
     thick1 = -1
     thick2 = 2
     camera.capture_frame()
-    tracking.detect_frame(camera.roi)
-    tracking.save_detections(offset=camera.roi_dims[:2])
-    tracking.draw_lines(camera.frame, smart_ids)
-    ring_center = tracking.get_centroid(ring_ids)
+    tracking.detect_frame(camera.gray, offset=camera.roi_dims[:2])
+    tracking.save_detections(offset=camera.roi_dims[:2],\
+        t_capture=camera.t_capture, seq=camera.seq, t_arrival=camera.t_arrival)
+    # ring centroid is updated with the rest of the tracking state every frame
+    ring_center = tracking.groups['ring'].centroid
+    # scheduler shrinks roi (never cropping out the ring tags) and skips drawing when tracking
+    # can't keep up with camera
+    side_length = tracking.scheduler.roi_side(side_length, tracking.groups['ring'].extent)
     camera.set_roi_dims(ring_center,side_length,side_length)
-    cv2.circle(camera.frame, (int(ring_center[0]),int(ring_center[1])),\
-    r, color1, thick1)
-    xlim = int(camera.roi_dims[0]+camera.roi_dims[2])
-    ylim = int(camera.roi_dims[1]+camera.roi_dims[3])
-    cv2.rectangle(camera.frame,(int(camera.roi_dims[0]),int(camera.roi_dims[1])),\
-        (xlim,ylim), color2, thick2)
+    if tracking.scheduler.skip_drawing:
+        return
+    # overlay is only drawn if frame is written or shown
+    tracking.overlay_lines(camera.overlay, smart_ids)
+    camera.overlay.add_circle(ring_center, r, color1, thick1)
+    camera.overlay.add_rectangle(camera.roi_dims, color2, thick2)
 
     camera.write_frame()
     camera.show_frame()
@@ -67,7 +65,8 @@ for id in tag_ids:
     else:
         values.append(None)
     length_dict = dict(zip(tag_ids,values))
-track = Tracking(tag_ids, history_len=None, length_dict=length_dict)
+track = Tracking(tag_ids, history_len=None, length_dict=length_dict,\
+    groups={'ring': ring_ids, 'smarticles': smart_ids}, target_period=1./fps)
 
 
 show_timer = True
@@ -88,8 +87,10 @@ while(True):
     # and will depend on the setup of your system
     # (e.g. you can't track at 30Hz in 4K with 40 tags in the frame)
     if show_timer and counter%10:
-        print('Period: {}s, Freq: {}Hz'.format(t_elapsed, 1/t_elapsed))
+        print('Period: {}s, Freq: {}Hz {}'.format(t_elapsed, 1/t_elapsed, track.degradations()))
     counter+=1
 
+# capture-to-state latency and dropped frames
+print(track.latency_stats())
 # When everything done, release the capture
 cam.close()
@@ -1,19 +1,15 @@
-import sys
-sys.path.append("../src")
-
-
 import cv2
-from tracking import Tracking
-from camera import Camera
+from smarticletracking.tracking import Tracking
+from smarticletracking.camera import Camera
 import time
 
 
 # helper function for doing a step of frame capture and tracking
 def step_function(camera, tracking, smart_ids):
     camera.capture_frame()
-    tracking.detect_frame(camera.roi)
-    tracking.save_detections()
-    tracking.draw_lines(camera.frame, smart_ids)
+    tracking.detect_frame(camera.gray)
+    tracking.save_detections(t_capture=camera.t_capture, seq=camera.seq, t_arrival=camera.t_arrival)
+    tracking.overlay_lines(camera.overlay, smart_ids)
 
     camera.write_frame()
     camera.show_frame()
@@ -56,5 +52,7 @@ while(True):
         print('Period: {}s, Freq: {}Hz'.format(t_elapsed, 1/t_elapsed))
     counter+=1
 
+# capture-to-state latency and dropped frames
+print(track.latency_stats())
 # When everything done, release the capture
 cam.close()
@@ -0,0 +1,5 @@
+# allows running command line interface with `python -m smarticletracking`
+import sys
+from .cli import main
+
+sys.exit(main())
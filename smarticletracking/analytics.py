@@ -0,0 +1,275 @@
+#analytics.py
+# Vectorized batch analytics over recorded smarticle trajectories
+
+import os
+import numpy as np
+
+# default number of frames processed at a time
+CHUNK_SIZE = 4096
+
+
+def _chunks(n, chunk_size):
+    '''
+    yields (start, stop) index pairs that cover range(n) in blocks of chunk_size
+    '''
+    if chunk_size is None:
+        chunk_size = n
+    chunk_size = max(int(chunk_size), 1)
+    for start in range(0, n, chunk_size):
+        yield start, min(start+chunk_size, n)
+
+
+def _masked(X, mask):
+    '''
+    returns float copy of X with entries set to nan where mask is False
+    '''
+    X = np.array(X, dtype=float)
+    if mask is not None:
+        X[~np.asarray(mask, dtype=bool)] = np.nan
+    return X
+
+
+def _allocate(out, shape):
+    '''
+    returns out if provided (e.g. an `np.memmap`), otherwise new array of given shape
+    '''
+    if out is None:
+        return np.empty(shape)
+    assert out.shape == shape, 'out should have shape {}'.format(shape)
+    return out
+
+
+def load_trajectory(path, mmap=True):
+    '''
+    ## Description
+    ---
+    Loads trajectory tensor saved by `Tracking.save_trajectory` or `Tracking.save_data`
+
+    ## Arguments
+    ---
+
+    | Argument | Type     | Description                                                                   | Default Value  |
+    | :------  | :--      | :---------                                                                    | :-----------   |
+    | path     | `string` | Directory written by `Tracking.save_trajectory`, or `.csv` from `save_data`   | N/A            |
+    | mmap     | `bool`   | *Optional:* Memory-map `.npy` arrays instead of reading them into RAM        | `True`         |
+    |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+    ## Returns
+    ---
+    `np.array` of timestamps with shape (T,)
+    `np.array` of states (x, y, theta) with shape (T, N, 3)
+    `np.array` of `bool` with shape (T, N) that is `False` for missed detections, or `None` if not saved
+    '''
+    if path.endswith('.csv'):
+        data = np.loadtxt(path, delimiter=',', ndmin=2)
+        t = data[:,0]
+        X = data[:,1:].reshape(data.shape[0], -1, 3)
+        return t, X, None
+
+    mmap_mode = 'r' if mmap else None
+    t = np.load(os.path.join(path, 't.npy'), mmap_mode=mmap_mode)
+    X = np.load(os.path.join(path, 'x.npy'), mmap_mode=mmap_mode)
+    mask_path = os.path.join(path, 'mask.npy')
+    mask = np.load(mask_path, mmap_mode=mmap_mode) if os.path.exists(mask_path) else None
+    return t, X, mask
+
+
+def velocities(t, X, mask=None, chunk_size=CHUNK_SIZE, out=None):
+    '''
+    ## Description
+    ---
+    Computes backward finite difference velocities (vx, vy, omega) of all tags. The
+    first frame, and any frame where the tag was missed in it or the previous frame, is `nan`
+
+    ## Arguments
+    ---
+
+    | Argument   | Type       | Description                                                         | Default Value  |
+    | :------    | :--        | :---------                                                          | :-----------   |
+    | t          | `np.array` | Timestamps with shape (T,)                                          | N/A            |
+    | X          | `np.array` | States with shape (T, N, 3)                                         | N/A            |
+    | mask       | `np.array` | *Optional:* (T, N) detection mask, missed frames are excluded      | `None`         |
+    | chunk_size | `int`      | *Optional:* Number of frames evaluated at a time                    | `CHUNK_SIZE`   |
+    | out        | `np.array` | *Optional:* (T, N, 3) output array, e.g. an `np.memmap`             | `None`         |
+    |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+    ## Returns
+    ---
+    `np.array` with shape (T, N, 3); `[...,2]` is the angular rate
+    '''
+    out = _allocate(out, X.shape)
+    if X.shape[0] == 0:
+        return out
+    out[0] = np.nan
+    for start, stop in _chunks(X.shape[0]-1, chunk_size):
+        # overlap one frame so every difference is computed within a chunk
+        sl = slice(start, stop+1)
+        Xc = _masked(X[sl], None if mask is None else mask[sl])
+        dt = np.diff(np.asarray(t[sl], dtype=float))[:,None,None]
+        out[start+1:stop+1] = np.diff(Xc, axis=0)/dt
+    return out
+
+
+def angular_rates(t, X, mask=None, chunk_size=CHUNK_SIZE, out=None):
+    '''
+    ## Description
+    ---
+    Computes angular rate of all tags, see `velocities` (`out` has shape (T, N))
+
+    ## Returns
+    ---
+    `np.array` with shape (T, N)
+    '''
+    out = _allocate(out, X.shape[:2])
+    velocities(t, X[...,2:], mask=mask, chunk_size=chunk_size, out=out[...,None])
+    return out
+
+
+def mean_squared_displacement(X, lags, mask=None, chunk_size=CHUNK_SIZE):
+    '''
+    ## Description
+    ---
+    Computes time averaged mean-squared displacement of tag positions for each lag (in frames).
+    Pairs of frames where the tag was missed in either frame are excluded
+
+    ## Arguments
+    ---
+
+    | Argument   | Type            | Description                                                    | Default Value  |
+    | :------    | :--             | :---------                                                     | :-----------   |
+    | X          | `np.array`      | States with shape (T, N, 3)                                    | N/A            |
+    | lags       | `list` of `int` | Lags in frames                                                 | N/A            |
+    | mask       | `np.array`      | *Optional:* (T, N) detection mask                              | `None`         |
+    | chunk_size | `int`           | *Optional:* Number of start frames evaluated at a time         | `CHUNK_SIZE`   |
+    |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+    ## Returns
+    ---
+    `np.array` with shape (len(lags), N), `nan` where there are no valid pairs
+    '''
+    T, N = X.shape[:2]
+    lags = np.atleast_1d(lags).astype(int)
+    total = np.zeros((len(lags), N))
+    count = np.zeros((len(lags), N))
+    for i, lag in enumerate(lags):
+        if lag <= 0 or lag >= T:
+            continue
+        for start, stop in _chunks(T-lag, chunk_size):
+            # chunk of start frames together with the frames lag after them
+            sl = slice(start, stop+lag)
+            Xc = _masked(X[sl,:,:2], None if mask is None else mask[sl])
+            sq = np.sum((Xc[lag:]-Xc[:-lag])**2, axis=-1)
+            valid = ~np.isnan(sq)
+            total[i] += np.where(valid, sq, 0.).sum(axis=0)
+            count[i] += valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total/count
+
+
+def mean_rotation(theta, theta0):
+    '''
+    ## Description
+    ---
+    Computes orientation of a group of tags as the circular mean of the rotation of each tag
+    since a reference (e.g. the first frame). The circular mean of the thetas themselves is
+    undefined for e.g. tags evenly spaced on a ring. Missed tags (`nan`) are ignored
+
+    ## Arguments
+    ---
+
+    | Argument | Type       | Description                                       | Default Value  |
+    | :------  | :--        | :---------                                        | :-----------   |
+    | theta    | `np.array` | Thetas of tags in group with shape (..., n)       | N/A            |
+    | theta0   | `np.array` | Reference thetas of tags with shape (n,)          | N/A            |
+    |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+    ## Returns
+    ---
+    `np.array` with shape (...) of orientations in [-pi, pi]
+    '''
+    dtheta = np.asarray(theta, dtype=float)-theta0
+    return np.arctan2(np.nansum(np.sin(dtheta), axis=-1), np.nansum(np.cos(dtheta), axis=-1))
+
+
+def centroid(X, idx, mask=None, chunk_size=CHUNK_SIZE, out=None):
+    '''
+    ## Description
+    ---
+    Computes centroid over time of a group of tags (e.g. the tags on the ring),
+    averaging only over tags detected in each frame
+
+    ## Arguments
+    ---
+
+    | Argument   | Type            | Description                                                    | Default Value  |
+    | :------    | :--             | :---------                                                     | :-----------   |
+    | X          | `np.array`      | States with shape (T, N, 3)                                    | N/A            |
+    | idx        | `list` of `int` | Column indices (not tag IDs) of tags in the group              | N/A            |
+    | mask       | `np.array`      | *Optional:* (T, N) detection mask                              | `None`         |
+    | chunk_size | `int`           | *Optional:* Number of frames evaluated at a time               | `CHUNK_SIZE`   |
+    | out        | `np.array`      | *Optional:* (T, 2) output array                                | `None`         |
+    |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+    ## Returns
+    ---
+    `np.array` with shape (T, 2), `nan` in frames where no tag in the group was detected
+    '''
+    idx = np.asarray(idx)
+    out = _allocate(out, (X.shape[0], 2))
+    for start, stop in _chunks(X.shape[0], chunk_size):
+        sl = slice(start, stop)
+        Xc = _masked(X[sl][:,idx,:2], None if mask is None else mask[sl][:,idx])
+        count = np.sum(~np.isnan(Xc[...,0]), axis=1)[:,None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[sl] = np.nansum(Xc, axis=1)/count
+    return out
+
+
+def orientation(X, idx, mask=None, chunk_size=CHUNK_SIZE, out=None):
+    '''
+    ## Description
+    ---
+    Computes orientation over time of a group of tags as their rotation since the first frame
+    (see `mean_rotation`), unwrapped over time so there are no discontinuities
+
+    ## Arguments
+    ---
+
+    | Argument   | Type            | Description                                                    | Default Value  |
+    | :------    | :--             | :---------                                                     | :-----------   |
+    | X          | `np.array`      | States with shape (T, N, 3)                                    | N/A            |
+    | idx        | `list` of `int` | Column indices (not tag IDs) of tags in the group              | N/A            |
+    | mask       | `np.array`      | *Optional:* (T, N) detection mask                              | `None`         |
+    | chunk_size | `int`           | *Optional:* Number of frames evaluated at a time               | `CHUNK_SIZE`   |
+    | out        | `np.array`      | *Optional:* (T,) output array                                  | `None`         |
+    |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+    ## Returns
+    ---
+    `np.array` with shape (T,), `nan` in frames where no tag in the group was detected
+    '''
+    idx = np.asarray(idx)
+    out = _allocate(out, (X.shape[0],))
+    if X.shape[0] == 0:
+        return out
+    # last valid orientation of previous chunk, carried over for unwrapping
+    last = None
+    # theta of each tag in first frame (states in history are interpolated over missed frames)
+    ref = np.array(X[0][idx,2], dtype=float)
+    for start, stop in _chunks(X.shape[0], chunk_size):
+        sl = slice(start, stop)
+        theta = _masked(X[sl][:,idx,2], None if mask is None else mask[sl][:,idx])
+        phi = mean_rotation(theta, ref)
+        valid = np.any(~np.isnan(theta), axis=1)
+        phi[~valid] = np.nan
+        if np.any(valid):
+            phi_valid = phi[valid]
+            if last is not None:
+                phi_valid = np.concatenate([[last], phi_valid])
+            phi_valid = np.unwrap(phi_valid)
+            if last is not None:
+                phi_valid = phi_valid[1:]
+            phi[valid] = phi_valid
+            last = phi_valid[-1]
+        out[sl] = phi
+    return out
@@ -0,0 +1,214 @@
+#calibration.py
+# Lens undistortion and pixel to world mapping of detected tag points
+
+import cv2
+import numpy as np
+
+
+class Calibration(object):
+    '''
+    ## Description
+    ---
+    Maps pixel coordinates of detected tag points to calibrated world coordinates (e.g. mm) by
+    undistorting them with the camera intrinsics and applying a pixel to world homography.
+    Only the center and corners of each detection are mapped, the frame itself is never remapped.
+    Either step is skipped if its parameters are `None`
+
+    '''
+
+    def __init__(self, camera_matrix=None, dist_coeffs=None, homography=None):
+        '''
+        ## Arguments
+        ---
+
+        | Argument      | Type       | Description                                                        | Default Value  |
+        | :------       | :--        | :---------                                                         | :-----------   |
+        | camera_matrix | `np.array` | *Optional:* 3x3 camera intrinsic matrix (e.g. from `cv2.calibrateCamera`) | `None`  |
+        | dist_coeffs   | `np.array` | *Optional:* Lens distortion coefficients                           | `None`         |
+        | homography    | `np.array` | *Optional:* 3x3 homography from undistorted pixels to world units  | `None`         |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        '''
+        self.camera_matrix = None if camera_matrix is None else np.asarray(camera_matrix, dtype=float)
+        if dist_coeffs is None and camera_matrix is not None:
+            dist_coeffs = np.zeros(5)
+        self.dist_coeffs = None if dist_coeffs is None else np.asarray(dist_coeffs, dtype=float)
+        self.homography = None if homography is None else np.asarray(homography, dtype=float)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        ## Description
+        ---
+        Loads calibration from `.npz` file with (optional) arrays `camera_matrix`, `dist_coeffs`
+        and `homography`, as written by `save`
+
+        ## Returns
+        ---
+        `Calibration`
+        '''
+        data = np.load(path)
+        return cls(*[data[key] if key in data else None\
+            for key in ('camera_matrix', 'dist_coeffs', 'homography')])
+
+    def save(self, path):
+        '''
+        Saves calibration to `.npz` file
+        '''
+        arrays = {key: value for key, value in [('camera_matrix', self.camera_matrix),\
+            ('dist_coeffs', self.dist_coeffs), ('homography', self.homography)] if value is not None}
+        np.savez(path, **arrays)
+
+    def fit_homography(self, pixel_pts, world_pts):
+        '''
+        ## Description
+        ---
+        Sets homography from at least 4 corresponding points (e.g. markers at known positions
+        on the arena), given in distorted pixel coordinates and world units
+
+        ## Arguments
+        ---
+
+        | Argument   | Type       | Description                               | Default Value  |
+        | :------    | :--        | :---------                                | :-----------   |
+        | pixel_pts  | `np.array` | (n, 2) points in pixel coordinates        | N/A            |
+        | world_pts  | `np.array` | (n, 2) corresponding points in world units| N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `np.array` 3x3 homography
+        '''
+        pixel_pts = self.undistort_points(pixel_pts)
+        self.homography, _ = cv2.findHomography(pixel_pts, np.asarray(world_pts, dtype=float))
+        return self.homography
+
+    def undistort_points(self, pts):
+        '''
+        ## Description
+        ---
+        Removes lens distortion from pixel coordinates, result is still in pixels
+
+        ## Arguments
+        ---
+
+        | Argument| Type       | Description                       | Default Value  |
+        | :------ | :--        | :---------                        | :-----------   |
+        | pts     | `np.array` | (n, 2) points in pixel coordinates| N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `np.array` (n, 2) undistorted points
+        '''
+        pts = np.asarray(pts, dtype=float).reshape(-1, 2)
+        if self.camera_matrix is None or len(pts) == 0:
+            return pts
+        return cv2.undistortPoints(pts.reshape(-1, 1, 2), self.camera_matrix, self.dist_coeffs,\
+            P=self.camera_matrix).reshape(-1, 2)
+
+    def to_world(self, pts):
+        '''
+        ## Description
+        ---
+        Maps pixel coordinates to world coordinates (undistortion followed by homography)
+
+        ## Arguments
+        ---
+
+        | Argument| Type       | Description                       | Default Value  |
+        | :------ | :--        | :---------                        | :-----------   |
+        | pts     | `np.array` | (n, 2) points in pixel coordinates| N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `np.array` (n, 2) points in world units
+        '''
+        pts = self.undistort_points(pts)
+        if self.homography is None:
+            return pts
+        return _apply_homography(self.homography, pts)
+
+    def to_pixel(self, pts):
+        '''
+        ## Description
+        ---
+        Maps world coordinates back to (distorted) pixel coordinates, e.g. for drawing or
+        centering the roi on a tracked position
+
+        ## Arguments
+        ---
+
+        | Argument| Type       | Description                       | Default Value  |
+        | :------ | :--        | :---------                        | :-----------   |
+        | pts     | `np.array` | (n, 2) points in world units      | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `np.array` (n, 2) points in pixel coordinates
+        '''
+        pts = np.asarray(pts, dtype=float).reshape(-1, 2)
+        if self.homography is not None:
+            pts = _apply_homography(np.linalg.inv(self.homography), pts)
+        if self.camera_matrix is None or len(pts) == 0:
+            return pts
+        # normalized camera coordinates, projected back through the lens model
+        normalized = _apply_homography(np.linalg.inv(self.camera_matrix), pts)
+        obj_pts = np.hstack([normalized, np.ones((len(pts), 1))])
+        pixels, _ = cv2.projectPoints(obj_pts, np.zeros(3), np.zeros(3), self.camera_matrix, self.dist_coeffs)
+        return pixels.reshape(-1, 2)
+
+    def pixels_per_unit(self, pt):
+        '''
+        ## Description
+        ---
+        Returns local scale (pixels per world unit) at world point `pt`, e.g. to size the roi
+
+        ## Returns
+        ---
+        `float`
+        '''
+        pt = np.asarray(pt, dtype=float)[:2]
+        pixels = self.to_pixel(np.array([pt, pt+[1., 0.], pt+[0., 1.]]))
+        return 0.5*(np.linalg.norm(pixels[1]-pixels[0])+np.linalg.norm(pixels[2]-pixels[0]))
+
+    def calibrate_detections(self, detections, offset):
+        '''
+        ## Description
+        ---
+        Maps center and corners of all detections to world coordinates in one batch
+
+        ## Arguments
+        ---
+
+        | Argument   | Type             | Description                                                                 | Default Value  |
+        | :------    | :--              | :---------                                                                  | :-----------   |
+        | detections | `list` of `dict` | Detections from AprilTag library                                            | N/A            |
+        | offset     | `list` of `int`  | Two element list that specifies offset from detection frame to global frame | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `list` of `dict` detections with `center` and `lb-rb-rt-lt` in world units (offset applied)
+        '''
+        if len(detections) == 0:
+            return detections
+        pts = np.array([np.vstack([det['center'], det['lb-rb-rt-lt']]) for det in detections])
+        pts = self.to_world(pts.reshape(-1, 2)+np.asarray(offset, dtype=float)).reshape(pts.shape)
+        calibrated = []
+        for det, det_pts in zip(detections, pts):
+            det = dict(det)
+            det['center'] = det_pts[0]
+            det['lb-rb-rt-lt'] = det_pts[1:]
+            calibrated.append(det)
+        return calibrated
+
+
+def _apply_homography(H, pts):
+    '''
+    applies 3x3 homography H to (n, 2) points
+    '''
+    pts = pts@H[:,:2].T+H[:,2]
+    return pts[:,:2]/pts[:,2:]
@@ -5,12 +5,17 @@
 
 import cv2
 import numpy as np
+import time
+from collections import deque
+from .frame_archive import FrameArchiveReader, FrameArchiveWriter
+from .overlay import Overlay
 
 class Camera(object):
 
 
     def __init__(self, frame_width, frame_height, fps, video_source=0, save_video=None,\
-        show_video=True, roi_dims=None, autofocus=0 ,focus_level=0, brightness=30, contrast=100):
+        show_video=True, roi_dims=None, autofocus=0 ,focus_level=0, brightness=30, contrast=100,\
+        save_raw=None, raw_slots=1000, raw_ring=False, raw_slot_dims=None, display_scale=1.):
         '''Initializes camera with specified settings as tuned tracking settings
         (ie. turns off autofocus, sets brightness and contrast)
 
@@ -22,11 +27,16 @@ class Camera(object):
         | frame_width  | `int`           | Frame width of camera capture                                                           | N/A            |
         | frame_height | `int`           | Frame height of camera capture                                                          | N/A            |
         | fps          | `int`           | Frames per second of camera capture                                                     | N/A            |
-        | video_source | `string`        | *Optional:* Path of input video file                                                    | 0              |
+        | video_source | `string`        | *Optional:* Path of input video file, raw frame archive (`.npy`) or `FrameArchiveReader` | 0             |
         | save_video   | `string`        | *Optional:* Save video to specified path                                                | `None`         |
         | show_video   | `bool`          | *Optional:* Show video to screen if `True`                                              | `False`        |
         | history_len  | `int`           | *Optional:* Max length of tracking history to be saved                                  | `None`         |
         | roi_dims     | `list` of `int` | *Optional:* Two element list that specifies offset from detection frame to global frame | `None`         |
+        | save_raw     | `string`        | *Optional:* Save raw grayscale roi frames to frame archive (`.npy`) at specified path   | `None`         |
+        | raw_slots    | `int`           | *Optional:* Number of frames preallocated in raw frame archive                          | 1000           |
+        | raw_ring     | `bool`          | *Optional:* Overwrite oldest frames in raw frame archive when it is full                | `False`        |
+        | raw_slot_dims| `list` of `int` | *Optional:* Max (height, width) of roi in raw frame archive, defaults to frame size     | `None`         |
+        | display_scale| `float`         | *Optional:* Scale of frame shown to screen, overlay is rendered at this resolution      | 1.             |
         |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
 
         '''
@@ -39,7 +49,13 @@ class Camera(object):
         self.brightness = brightness
         self.contrast = contrast
         self.fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-        self.cap = cv2.VideoCapture(self.video_source) # sets input source for video capture
+        # sets input source for video capture
+        if isinstance(self.video_source, FrameArchiveReader):
+            self.cap = self.video_source
+        elif isinstance(self.video_source, str) and self.video_source.endswith('.npy'):
+            self.cap = FrameArchiveReader(self.video_source)
+        else:
+            self.cap = cv2.VideoCapture(self.video_source)
         self.cap.set(6, self.fourcc) # setting MJPG codec
         self.cap.set(3, frame_width) # Width
         self.cap.set(4, frame_height) # Height
@@ -65,11 +81,36 @@ class Camera(object):
         else:
             self.out = None
 
+        # frame stamps: monotonic capture time and sequence number of most recent frame
+        self.from_file = isinstance(self.video_source, str) or isinstance(self.cap, FrameArchiveReader)
+        self.t_capture = None
+        self.seq = -1
+        # monotonic time latency of most recent frame is measured from (see _stamp_frame)
+        self.t_arrival = None
+        self._t_first = None
+        # capture time of previous live frame and recent intervals, to estimate the actual frame period
+        self._t_last = None
+        self._intervals = deque(maxlen=30)
+
+        self.save_raw = save_raw
+        if self.save_raw is not None:
+            if raw_slot_dims is None:
+                raw_slot_dims = (self.frame_height, self.frame_width)
+            self.raw_out = FrameArchiveWriter(self.save_raw, raw_slots, raw_slot_dims, ring=raw_ring)
+        else:
+            self.raw_out = None
+
+        # drawing primitives for current frame, rendered only when frame is shown or written
+        self.overlay = Overlay()
+        self.display_scale = display_scale
+        self._overlay_rendered = False
+
     def set_roi_dims(self, center, h, w):
         '''
         ## Description
         ---
         Sets `roi_dims` or region of interest dimension that define a cropped area of the entire captured frame.
+        The roi is clipped to the frame
 
         ## Arguments
         ---
@@ -87,18 +128,22 @@ class Camera(object):
 
         '''
 
-        x = int(center[0]-0.5*w)
-        np.clip(x,0,self.frame_width)
-        y =int(center[1]-0.5*h)
-        np.clip(y,0,self.frame_height)
+        # keep roi inside frame (shifted, not cropped, near the edges) so it is never empty
+        w = int(min(w, self.frame_width))
+        h = int(min(h, self.frame_height))
+        x = int(np.clip(center[0]-0.5*w, 0, self.frame_width-w))
+        y = int(np.clip(center[1]-0.5*h, 0, self.frame_height-h))
 
-        self.roi_dims=[x,y,int(h), int(w)]
+        self.roi_dims=[x, y, w, h]
 
     def capture_frame(self):
         '''
         ## Description
         ---
-        Captures frame with attribute `cap` and crops according to `roi_dims`
+        Captures frame with attribute `cap` and crops according to `roi_dims`. Also stamps the
+        frame with a monotonic capture time `t_capture` and sequence number `seq`, see `_stamp_frame`,
+        converts the roi to grayscale `gray` (pass it to `Tracking.detect_frame` so it is not
+        converted again) and writes it to the raw frame archive if `self.save_raw` is not `None`
 
         ## Arguments
         ---
@@ -112,17 +157,100 @@ class Camera(object):
         '''
         # region of interest (crop region) dimensions
         [x, y, w, h] = self.roi_dims
-        self.ret, self.frame = self.cap.read()
+        self.ret = self.cap.grab()
+        t_grab = time.monotonic()
+        self.ret, self.frame = self.cap.retrieve()
+        if not self.ret:
+            # end of video or camera disconnected
+            self.roi = None
+            self.gray = None
+            return [self.ret, self.frame, self.roi]
+        self._stamp_frame(t_grab)
+        self.overlay.clear()
+        self._overlay_rendered = False
+        if isinstance(self.cap, FrameArchiveReader):
+            # replay the recorded roi so detections are bit-exact
+            self.roi_dims = list(self.cap.roi_dims)
+            [x, y, w, h] = self.roi_dims
         # save cropped frame
         self.roi = self.frame[y:y+h, x:x+w]
+        # grayscale roi, converted once per frame for both detection and raw frame archive
+        self.gray = self.roi if self.roi.ndim == 2 else cv2.cvtColor(self.roi, cv2.COLOR_BGR2GRAY)
+        if self.raw_out is not None:
+            self.write_raw_frame()
 
         return [self.ret, self.frame, self.roi]
 
+    def _stamp_frame(self, t_grab):
+        '''
+        ## Description
+        ---
+        Sets `t_capture` and `seq` of the most recently grabbed frame. For live cameras the
+        backend buffer timestamp is used where it is on the monotonic clock (e.g. V4L2), otherwise
+        the time right after the grab. Live cameras expose no frame counter, so `seq` is a
+        heuristic: it advances by the number of frame periods since the previous frame, with the
+        period estimated as the median of recent frame intervals rather than the nominal fps,
+        and gaps shorter than 1.5 periods count as one frame. For video files `t_capture` is the
+        recording time of the frame (backend position, measured from the first frame) and `seq` is
+        the frame position in the file. Frames replayed from a raw frame archive keep their recorded `t_capture` and `seq`.
+        `t_arrival` is the capture time on the current monotonic clock that latency is measured
+        from: `t_capture` for live cameras, or the time of the grab for video files and replayed frames
+
+        ## Arguments
+        ---
+
+        | Argument     | Type            | Description                                                        | Default Value  |
+        | :------      | :--             | :---------                                                         | :-----------   |
+        | t_grab       | `float`         | `time.monotonic()` right after the frame was grabbed               | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        None
+
+        '''
+        if isinstance(self.cap, FrameArchiveReader):
+            # recorded stamps, so reprocessed timestamps and latencies match the original run
+            self.t_capture = self.cap.t_capture
+            self.seq = self.cap.seq
+            self.t_arrival = t_grab
+            return
+        if self.from_file:
+            # recording time of frame in file, measured from first frame; latency is processing time
+            t_pos = self.cap.get(cv2.CAP_PROP_POS_MSEC)/1000.
+            if self._t_first is None:
+                self._t_first = t_pos
+            self.t_capture = t_pos-self._t_first
+            self.seq = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))-1
+            self.t_arrival = t_grab
+            return
+        t_backend = self.cap.get(cv2.CAP_PROP_POS_MSEC)/1000.
+        # only trust backend timestamp if it is in the last second on the monotonic clock
+        if t_grab-1. < t_backend <= t_grab:
+            self.t_capture = t_backend
+        else:
+            self.t_capture = t_grab
+        self.t_arrival = self.t_capture
+        if self._t_last is None:
+            self._t_last = self.t_capture
+            self.seq += 1
+            return
+        dt = self.t_capture-self._t_last
+        self._t_last = self.t_capture
+        if dt <= 0:
+            # same buffer delivered again
+            return
+        self._intervals.append(dt)
+        # measured period, webcams often deliver fewer frames than requested (e.g. in low light)
+        period = np.median(self._intervals)
+        self.seq += int(round(dt/period)) if dt > 1.5*period else 1
+
     def write_frame(self, frame=None):
         '''
         ## Description
         ---
-        Writes video frame to file specified in class constructor if `self.save_video' is `True`
+        Writes video frame to file specified in class constructor if `self.save_video' is `True`.
+        `self.overlay` is rendered onto the frame if it is not provided
 
         ## Arguments
         ---
@@ -137,16 +265,67 @@ class Camera(object):
         None
 
         '''
-        if frame is None:
-            frame = self.frame
         if self.save_video is not None:
+            if frame is None:
+                frame = self.render_overlay()
             self.out.write(frame)
 
+    def render_overlay(self):
+        '''
+        ## Description
+        ---
+        Renders `self.overlay` onto `self.frame` at full resolution, once per captured frame
+
+        ## Arguments
+        ---
+        None
+
+        ## Returns
+        ---
+        3D `np.array` of RGB pixel values of frame with overlay
+
+        '''
+        if not self._overlay_rendered:
+            if self.frame.ndim == 2:
+                # frames replayed from a raw frame archive are grayscale, draw and write in color
+                self.frame = cv2.cvtColor(self.frame, cv2.COLOR_GRAY2BGR)
+            self.overlay.render(self.frame)
+            self._overlay_rendered = True
+        return self.frame
+
+    def write_raw_frame(self, gray=None):
+        '''
+        ## Description
+        ---
+        Writes grayscale roi frame, with its capture stamp and roi offset, to raw frame archive
+        specified in class constructor if `self.save_raw` is not `None`. Called by `capture_frame`
+        for every captured frame
+
+        ## Arguments
+        ---
+
+        | Argument     | Type            | Description                                                        | Default Value  |
+        | :------      | :--             | :---------                                                         | :-----------   |
+        | gray         | `np.array`      | *Optional:* 2D `np.array` of grayscale roi. If not provided, `self.gray` is used | `None` |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `bool` that is `False` if frame was not written
+
+        '''
+        if self.raw_out is None:
+            return False
+        if gray is None:
+            gray = self.gray
+        return self.raw_out.write(gray, self.t_capture, self.seq, self.roi_dims[:2])
+
     def show_frame(self, frame=None):
         '''
         ## Description
         ---
-        Displays video frame if `self.show_video' is `True`
+        Displays video frame if `self.show_video' is `True`, scaled by `self.display_scale`.
+        `self.overlay` is rendered onto the frame if it is not provided
 
         ## Arguments
         ---
@@ -161,10 +340,22 @@ class Camera(object):
         None
 
         '''
-        if frame is None:
-            frame = self.frame
-        if self.show_video is True:
-            cv2.imshow('frame', frame)
+        if self.show_video is not True:
+            return
+        if frame is None and not self._overlay_rendered and self.display_scale != 1:
+            # render overlay on reduced resolution frame instead of full frame
+            frame = cv2.resize(self.frame, None, fx=self.display_scale, fy=self.display_scale,\
+                interpolation=cv2.INTER_AREA)
+            if frame.ndim == 2:
+                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+            self.overlay.render(frame, self.display_scale)
+        else:
+            if frame is None:
+                frame = self.render_overlay()
+            if self.display_scale != 1:
+                frame = cv2.resize(frame, None, fx=self.display_scale, fy=self.display_scale,\
+                    interpolation=cv2.INTER_AREA)
+        cv2.imshow('frame', frame)
 
 
 
@@ -186,4 +377,7 @@ class Camera(object):
         self.cap.release()
         if self.out is not None:
             self.out.release()
-        cv2.destroyAllWindows()
+        if self.raw_out is not None:
+            self.raw_out.close()
+        if self.show_video:
+            cv2.destroyAllWindows()
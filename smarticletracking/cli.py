@@ -0,0 +1,340 @@
+#cli.py
+# Command line entry point for live and offline smarticle tracking jobs
+
+# cv2 and apriltag are only imported by the job functions (via Camera and
+# Tracking), so that `smarticletracking --help` and config errors are fast
+import argparse
+import json
+import os
+import sys
+import time
+
+# default job configuration, overridden by config file
+DEFAULT_CONFIG = {
+    # tag IDs to track and tag side lengths in mm (tags without a length are not used for scale)
+    'tag_ids': [],
+    'tag_lengths': {},
+    # groups of tags to track collective state of, as {name: tag IDs}
+    'groups': {},
+    # Camera settings
+    'camera': {'frame_width': 1920, 'frame_height': 1080, 'fps': 20},
+    # roi policy: 'full' frame, or square of side 'size_mm' following the 'centroid' of 'tag_ids'
+    'roi': {'policy': 'full', 'tag_ids': [], 'size_mm': None},
+    # optional .npz camera calibration (see Calibration.save), tracking data is then in world units
+    'calibration': None,
+    # frame time budget (s) to degrade tracking quality to stay within, see FrameScheduler
+    'target_period': None,
+    # tag IDs to draw orientation lines for
+    'draw_ids': [],
+    # tracking data format: 'csv' (Tracking.save_data) or 'npy' (Tracking.save_trajectory)
+    'output': {'format': 'csv', 'video': False},
+    # print progress every this many frames
+    'progress_every': 500,
+}
+
+VIDEO_EXTENSIONS = ('.avi', '.mp4', '.mov', '.mkv', '.npy')
+
+
+def load_config(path):
+    '''
+    ## Description
+    ---
+    Loads JSON job config and fills in defaults from `DEFAULT_CONFIG`
+
+    ## Arguments
+    ---
+
+    | Argument | Type     | Description              | Default Value  |
+    | :------  | :--      | :---------               | :-----------   |
+    | path     | `string` | Path of JSON config file | N/A            |
+    |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+    ## Returns
+    ---
+    `dict` config
+    '''
+    with open(path) as f:
+        user_config = json.load(f)
+    config = {}
+    for key, default in DEFAULT_CONFIG.items():
+        value = user_config.get(key, default)
+        if isinstance(default, dict):
+            value = dict(default, **value)
+        config[key] = value
+    unknown = set(user_config)-set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError('Unknown config keys: {}'.format(', '.join(sorted(unknown))))
+    if len(config['tag_ids']) == 0:
+        raise ValueError('Config must specify tag_ids')
+    if config['roi']['policy'] not in ('full', 'centroid'):
+        raise ValueError('roi policy should be "full" or "centroid"')
+    if config['output']['format'] not in ('csv', 'npy'):
+        raise ValueError('output format should be "csv" or "npy"')
+    # JSON keys are strings
+    config['tag_lengths'] = {int(k): v for k, v in config['tag_lengths'].items()}
+    if config['roi']['policy'] == 'centroid':
+        roi_ids = config['roi']['tag_ids']
+        if len(roi_ids) == 0 or any(tag_id not in config['tag_ids'] for tag_id in roi_ids):
+            raise ValueError('roi policy "centroid" needs roi.tag_ids from tag_ids')
+        size_mm = config['roi']['size_mm']
+        if isinstance(size_mm, bool) or not isinstance(size_mm, (int, float)) or size_mm <= 0:
+            raise ValueError('roi policy "centroid" needs a positive roi.size_mm')
+        # roi size is converted to pixels with the scale factor of tags with a known length
+        if not any(config['tag_lengths'].get(tag_id) for tag_id in config['tag_ids']):
+            raise ValueError('roi policy "centroid" needs tag_lengths of at least one tag')
+    return config
+
+
+def output_path(path, config):
+    '''
+    returns path with extension of output format appended unless it already has it
+    (for 'npy' a directory, without a '.npy' extension)
+    '''
+    root, ext = os.path.splitext(path)
+    if config['output']['format'] == 'csv':
+        return path if ext == '.csv' else path+'.csv'
+    return root if ext == '.npy' else path
+
+
+def video_path(out_path, config):
+    '''
+    returns path of tracked video saved next to tracking data at `out_path` (see `output_path`)
+    '''
+    if config['output']['format'] == 'csv':
+        out_path = out_path[:-len('.csv')]
+    return out_path+'_tracked.avi'
+
+
+def run_job(config, video_source, out_path, show_video=False, duration=None, label=None):
+    '''
+    ## Description
+    ---
+    Tracks tags in `video_source` according to `config` until the video ends, `duration`
+    has passed or 'q' is pressed, then saves tracking data to `out_path`
+
+    ## Arguments
+    ---
+
+    | Argument     | Type            | Description                                                   | Default Value  |
+    | :------      | :--             | :---------                                                    | :-----------   |
+    | config       | `dict`          | Job config, see `load_config`                                 | N/A            |
+    | video_source | `string`/`int`  | Camera index, video file or raw frame archive                 | N/A            |
+    | out_path     | `string`        | Path to save tracking data                                    | N/A            |
+    | show_video   | `bool`          | *Optional:* Show video to screen                              | `False`        |
+    | duration     | `float`         | *Optional:* Max duration of job in seconds                    | `None`         |
+    | label        | `string`        | *Optional:* Label printed with progress                       | `None`         |
+    |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+    ## Returns
+    ---
+    `dict` summary with keys `source`, `output`, `frames`, `elapsed`, `fps`
+    '''
+    from .calibration import Calibration
+    from .camera import Camera
+    from .tracking import Tracking
+
+    if label is None:
+        label = str(video_source)
+    out_path = output_path(out_path, config)
+    save_video = video_path(out_path, config) if config['output']['video'] else None
+    cam = Camera(video_source=video_source, save_video=save_video, show_video=show_video,\
+        **config['camera'])
+    tag_ids = config['tag_ids']
+    length_dict = {tag_id: config['tag_lengths'].get(tag_id) for tag_id in tag_ids}
+    calibration = None if config['calibration'] is None else Calibration.load(config['calibration'])
+    track = Tracking(tag_ids, length_dict=length_dict, groups=config['groups'], calibration=calibration,\
+        target_period=config['target_period'])
+    roi = config['roi']
+    draw = show_video or save_video is not None
+
+    try:
+        track.start(cam)
+        if roi['policy'] == 'centroid':
+            side_length = roi['size_mm']*track.get_scale_factor()
+        frames = 0
+        t_start = time.monotonic()
+        while True:
+            cam.capture_frame()
+            if not cam.ret:
+                break
+            track.detect_frame(cam.gray, offset=cam.roi_dims[:2])
+            track.save_detections(offset=cam.roi_dims[:2], t_capture=cam.t_capture, seq=cam.seq,\
+                t_arrival=cam.t_arrival)
+            if roi['policy'] == 'centroid':
+                center = track.get_centroid(roi['tag_ids'])
+                side = side_length
+                if track.scheduler is not None:
+                    side = track.scheduler.roi_side(side, track.get_extent(roi['tag_ids']))
+                if calibration is not None:
+                    # roi is in pixels, centroid and scale factor are in world units
+                    side *= calibration.pixels_per_unit(center)
+                    center = calibration.to_pixel(center)[0]
+                cam.set_roi_dims(center, side, side)
+            if draw and not track.degradations().get('skip_drawing', False):
+                track.overlay_lines(cam.overlay, config['draw_ids'])
+                cam.write_frame()
+                cam.show_frame()
+            frames += 1
+            elapsed = time.monotonic()-t_start
+            if config['progress_every'] and frames % config['progress_every'] == 0:
+                print('{}: {} frames, {:.1f} fps {}'.format(label, frames, frames/elapsed,\
+                    track.degradations() or ''), file=sys.stderr)
+            if duration is not None and elapsed > duration:
+                break
+            if show_video and track.q_pressed():
+                break
+    finally:
+        cam.close()
+
+    elapsed = time.monotonic()-t_start
+    if config['output']['format'] == 'csv':
+        track.save_data(out_path)
+    else:
+        track.save_trajectory(out_path)
+    return {'source': label, 'output': out_path, 'frames': frames, 'elapsed': elapsed,\
+        'fps': frames/elapsed if elapsed > 0 else 0., 'latency': track.latency_stats()}
+
+
+def _process_file(args):
+    '''
+    worker pool job: processes one recording, returns summary or error message
+    '''
+    config, path, out_path = args
+    try:
+        return run_job(config, path, out_path, label=os.path.basename(path))
+    except Exception as e:
+        return {'source': os.path.basename(path), 'error': repr(e)}
+
+
+def find_recordings(paths):
+    '''
+    ## Description
+    ---
+    Expands list of files and directories into sorted list of recordings
+
+    ## Arguments
+    ---
+
+    | Argument | Type               | Description                         | Default Value  |
+    | :------  | :--                | :---------                          | :-----------   |
+    | paths    | `list` of `string` | Recording files and/or directories  | N/A            |
+    |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+    ## Returns
+    ---
+    `list` of `string` paths
+    '''
+    recordings = []
+    for path in paths:
+        if os.path.isdir(path):
+            recordings += sorted(os.path.join(path, f) for f in os.listdir(path)\
+                if f.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            recordings.append(path)
+    return recordings
+
+
+def track_command(args):
+    '''
+    runs live tracking job
+    '''
+    config = load_config(args.config)
+    source = int(args.source) if args.source.isdigit() else args.source
+    summary = run_job(config, source, args.output, show_video=args.show, duration=args.duration)
+    print(json.dumps(summary))
+    return 0
+
+
+def process_command(args):
+    '''
+    processes recordings concurrently with a pool of `args.jobs` worker processes
+    '''
+    config = load_config(args.config)
+    recordings = find_recordings(args.inputs)
+    if len(recordings) == 0:
+        print('No recordings found', file=sys.stderr)
+        return 1
+    # outputs keep the path (with extension) of each recording relative to the deepest
+    # directory containing all of them, so recordings never overwrite each other's data
+    paths = [os.path.abspath(path) for path in recordings]
+    root = os.path.commonpath([os.path.dirname(path) for path in paths])
+    outputs = [output_path(os.path.join(args.output, os.path.relpath(path, root)), config)\
+        for path in paths]
+    duplicates = sorted(set(out for out in outputs if outputs.count(out) > 1))
+    if duplicates:
+        raise ValueError('Recordings map to same output: {}'.format(', '.join(duplicates)))
+    for out in outputs:
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    jobs = [(config, path, out) for path, out in zip(recordings, outputs)]
+
+    t_start = time.monotonic()
+    failed = 0
+    total_frames = 0
+    if args.jobs == 1:
+        results = map(_process_file, jobs)
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        pool = ProcessPoolExecutor(max_workers=args.jobs)
+        results = (f.result() for f in as_completed([pool.submit(_process_file, job) for job in jobs]))
+    for i, summary in enumerate(results):
+        if 'error' in summary:
+            failed += 1
+            print('[{}/{}] {}: failed with {}'.format(i+1, len(jobs), summary['source'],\
+                summary['error']), file=sys.stderr)
+        else:
+            total_frames += summary['frames']
+            print('[{}/{}] {}: {} frames in {:.1f}s ({:.1f} fps) -> {}'.format(i+1, len(jobs),\
+                summary['source'], summary['frames'], summary['elapsed'], summary['fps'],\
+                summary['output']), file=sys.stderr)
+    if args.jobs != 1:
+        pool.shutdown()
+    elapsed = time.monotonic()-t_start
+    print('Processed {} recordings ({} failed), {} frames in {:.1f}s ({:.1f} fps)'.format(\
+        len(jobs), failed, total_frames, elapsed, total_frames/elapsed if elapsed > 0 else 0.),\
+        file=sys.stderr)
+    return 1 if failed else 0
+
+
+def build_parser():
+    '''
+    returns argument parser of `smarticletracking` command
+    '''
+    parser = argparse.ArgumentParser(prog='smarticletracking',\
+        description='Track smarticles with April Tags')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    track = subparsers.add_parser('track', help='track tags live from a camera')
+    track.add_argument('config', help='JSON job config')
+    track.add_argument('-o', '--output', required=True, help='path to save tracking data')
+    track.add_argument('-s', '--source', default='0', help='camera index or video path (default: 0)')
+    track.add_argument('--show', action='store_true', help='show video, press q to stop')
+    track.add_argument('-d', '--duration', type=float, default=None, help='stop after this many seconds')
+    track.set_defaults(func=track_command)
+
+    process = subparsers.add_parser('process', help='track tags in recorded videos')
+    process.add_argument('config', help='JSON job config')
+    process.add_argument('inputs', nargs='+', help='recordings or directories of recordings')
+    process.add_argument('-o', '--output', required=True, help='directory to save tracking data')
+    process.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,\
+        help='number of recordings processed concurrently (default: number of CPUs)')
+    process.set_defaults(func=process_command)
+    return parser
+
+
+def main(argv=None):
+    '''
+    ## Description
+    ---
+    Entry point of `smarticletracking` command
+
+    ## Returns
+    ---
+    `int` exit status
+    '''
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (ValueError, OSError) as e:
+        print('smarticletracking: error: {}'.format(e), file=sys.stderr)
+        return 2
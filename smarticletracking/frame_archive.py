@@ -0,0 +1,237 @@
+#frame_archive.py
+# Raw grayscale frame archive in a preallocated memory-mapped file
+
+import cv2
+import numpy as np
+
+
+def archive_dtype(slot_height, slot_width):
+    '''
+    ## Description
+    ---
+    Returns record dtype of one archive slot: write count `n` (-1 for an empty slot), capture
+    time `t`, sequence number `seq`, `roi` as [x, y, w, h] and grayscale `pixels` of the roi,
+    stored in the top left corner of the slot
+
+    ## Arguments
+    ---
+
+    | Argument     | Type    | Description                        | Default Value  |
+    | :------      | :--     | :---------                         | :-----------   |
+    | slot_height  | `int`   | Max height in pixels of stored roi | N/A            |
+    | slot_width   | `int`   | Max width in pixels of stored roi  | N/A            |
+    |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+    ## Returns
+    ---
+    `np.dtype`
+    '''
+    return np.dtype([('n', '<i8'), ('t', '<f8'), ('seq', '<i8'), ('roi', '<i4', (4,)),\
+        ('pixels', 'u1', (slot_height, slot_width))])
+
+
+class FrameArchiveWriter(object):
+    '''
+    ## Description
+    ---
+    Writes raw grayscale roi frames with their timestamps and roi offsets into a preallocated
+    memory-mapped `.npy` file of `n_slots` records. If `ring` is `True`, the oldest frames are
+    overwritten once the file is full, otherwise frames past the end are not recorded
+
+    '''
+
+    def __init__(self, path, n_slots, slot_dims, ring=False):
+        '''
+        ## Arguments
+        ---
+
+        | Argument     | Type            | Description                                                | Default Value  |
+        | :------      | :--             | :---------                                                 | :-----------   |
+        | path         | `string`        | Path of archive file (`.npy`)                              | N/A            |
+        | n_slots      | `int`           | Number of frames the archive holds                         | N/A            |
+        | slot_dims    | `list` of `int` | Max (height, width) in pixels of stored roi                | N/A            |
+        | ring         | `bool`          | *Optional:* Overwrite oldest frames when archive is full   | `False`        |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        '''
+        self.path = path
+        self.n_slots = int(n_slots)
+        self.slot_dims = (int(slot_dims[0]), int(slot_dims[1]))
+        self.ring = ring
+        self.count = 0
+        self.data = np.lib.format.open_memmap(path, mode='w+',\
+            dtype=archive_dtype(*self.slot_dims), shape=(self.n_slots,))
+        self.data['n'] = -1
+
+    def write(self, gray, t, seq, offset):
+        '''
+        ## Description
+        ---
+        Writes grayscale roi frame to next slot of archive
+
+        ## Arguments
+        ---
+
+        | Argument| Type            | Description                                                  | Default Value  |
+        | :------ | :--             | :---------                                                   | :-----------   |
+        | gray    | `np.array`      | 2D `np.array` of grayscale roi pixel values                  | N/A            |
+        | t       | `float`         | Capture time of frame                                        | N/A            |
+        | seq     | `int`           | Sequence number of frame                                     | N/A            |
+        | offset  | `list` of `int` | (x, y) offset of roi in full frame                           | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `bool` that is `False` if the archive is full and frame was not written
+        '''
+        if self.count >= self.n_slots and not self.ring:
+            return False
+        h, w = gray.shape[:2]
+        assert h <= self.slot_dims[0] and w <= self.slot_dims[1],\
+            'roi of shape {} does not fit in slot of shape {}'.format((h, w), self.slot_dims)
+        rec = self.data[self.count % self.n_slots]
+        rec['t'] = t
+        rec['seq'] = seq
+        rec['roi'] = [offset[0], offset[1], w, h]
+        rec['pixels'][:h,:w] = gray
+        # write count last so a partially written slot is never read as valid
+        rec['n'] = self.count
+        self.count += 1
+        return True
+
+    def close(self):
+        '''
+        Flushes archive to disk
+        '''
+        self.data.flush()
+        del self.data
+
+
+class FrameArchiveReader(object):
+    '''
+    ## Description
+    ---
+    Replays a frame archive written by `FrameArchiveWriter` oldest frame first. Implements the
+    parts of the `cv2.VideoCapture` interface used by `Camera`, so it can be passed as `video_source`.
+    Each frame is a 2D grayscale frame of size `frame_dims` with the recorded roi pasted at its
+    recorded offset; `roi_dims` is the recorded roi, and `t_capture` and `seq` the recorded stamp,
+    of the current frame
+
+    '''
+
+    def __init__(self, path, frame_dims=None):
+        '''
+        ## Arguments
+        ---
+
+        | Argument     | Type            | Description                                                        | Default Value  |
+        | :------      | :--             | :---------                                                         | :-----------   |
+        | path         | `string`        | Path of archive file (`.npy`)                                      | N/A            |
+        | frame_dims   | `list` of `int` | *Optional:* (height, width) of replayed frame, default fits all rois | `None`       |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        '''
+        self.path = path
+        self.data = np.load(path, mmap_mode='r')
+        n = self.data['n']
+        valid = np.flatnonzero(n >= 0)
+        self.order = valid[np.argsort(n[valid])]
+        if frame_dims is None:
+            roi = self.data['roi'][self.order]
+            if len(roi) > 0:
+                frame_dims = (int((roi[:,1]+roi[:,3]).max()), int((roi[:,0]+roi[:,2]).max()))
+            else:
+                frame_dims = self.data.dtype['pixels'].shape
+        self.frame_dims = frame_dims
+        t = self.data['t'][self.order]
+        self.fps = 1./np.median(np.diff(t)) if len(t) > 1 else 0.
+        # reused output frame, only previous roi is cleared between frames
+        self._frame = np.zeros(self.frame_dims, dtype=np.uint8)
+        self._pos = 0
+        self._rec = None
+        self.roi_dims = [0, 0, self.frame_dims[1], self.frame_dims[0]]
+        self.t_capture = None
+        self.seq = None
+
+    def __len__(self):
+        '''
+        Number of frames in archive
+        '''
+        return len(self.order)
+
+    def isOpened(self):
+        '''
+        Returns `True` until `release` is called
+        '''
+        return self.data is not None
+
+    def grab(self):
+        '''
+        Advances to next frame, returns `False` at end of archive
+        '''
+        if self._pos >= len(self.order):
+            self._rec = None
+            self.t_capture = self.seq = None
+            return False
+        self._rec = self.data[self.order[self._pos]]
+        self._pos += 1
+        # recorded stamp as stored, CAP_PROP_POS_MSEC would round trip t through milliseconds
+        self.t_capture = float(self._rec['t'])
+        self.seq = int(self._rec['seq'])
+        return True
+
+    def retrieve(self):
+        '''
+        Returns (`bool`, frame) for most recently grabbed frame
+        '''
+        if self._rec is None:
+            return False, None
+        x, y, w, h = self.roi_dims
+        self._frame[y:y+h, x:x+w] = 0
+        x, y, w, h = [int(v) for v in self._rec['roi']]
+        self._frame[y:y+h, x:x+w] = self._rec['pixels'][:h,:w]
+        self.roi_dims = [x, y, w, h]
+        return True, self._frame
+
+    def read(self):
+        '''
+        Grabs and retrieves next frame
+        '''
+        self.grab()
+        return self.retrieve()
+
+    def get(self, prop):
+        '''
+        Returns `cv2.CAP_PROP_*` property; position properties are the recorded `seq` and `t` of current frame
+        '''
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frame_dims[1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frame_dims[0]
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.order)
+        if self._rec is None:
+            return 0
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self._rec['seq']+1
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self._rec['t']*1000.
+        return 0
+
+    def set(self, prop, value):
+        '''
+        Seeks to frame index with `cv2.CAP_PROP_POS_FRAMES`, other properties are ignored
+        '''
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self._pos = int(np.clip(value, 0, len(self.order)))
+            return True
+        # capture settings (codec, focus, etc.) do not apply to archive
+        return False
+
+    def release(self):
+        '''
+        Releases memory map of archive
+        '''
+        self.data = None
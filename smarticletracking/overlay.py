@@ -0,0 +1,148 @@
+#overlay.py
+# Deferred, batched drawing of tracking overlays
+
+import cv2
+import numpy as np
+
+
+class Overlay(object):
+    '''
+    ## Description
+    ---
+    Collects drawing primitives (lines, rectangles, circles) for a frame as arrays and renders
+    them in one batched pass per color and thickness, e.g. one `cv2.polylines` call for the
+    orientation lines of all tags. Nothing is drawn until `render` is called, so frames that are
+    never shown or written are never drawn on
+
+    '''
+
+    def __init__(self):
+        # polylines grouped by (color, thickness, closed): list of (n, k, 2) arrays
+        self.polylines = {}
+        # circles: list of (center, radius, color, thickness)
+        self.circles = []
+
+    def clear(self):
+        '''
+        ## Description
+        ---
+        Removes all primitives, called at the start of every frame
+
+        ## Returns
+        ---
+        void
+        '''
+        self.polylines = {}
+        self.circles = []
+
+    def is_empty(self):
+        '''
+        Returns `True` if there is nothing to draw
+        '''
+        return len(self.polylines) == 0 and len(self.circles) == 0
+
+    def add_lines(self, start, end, color=(0,255,0), thickness=2):
+        '''
+        ## Description
+        ---
+        Adds line segments from `start` to `end`
+
+        ## Arguments
+        ---
+
+        | Argument  | Type       | Description                     | Default Value  |
+        | :------   | :--        | :---------                      | :-----------   |
+        | start     | `np.array` | (n, 2) start points of lines    | N/A            |
+        | end       | `np.array` | (n, 2) end points of lines      | N/A            |
+        | color     | `tuple`    | *Optional:* BGR color           | (0,255,0)      |
+        | thickness | `int`      | *Optional:* Line thickness      | 2              |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        void
+        '''
+        pts = np.stack([np.asarray(start, dtype=float), np.asarray(end, dtype=float)], axis=1)
+        self._add_polylines(pts, color, thickness, False)
+
+    def add_rectangle(self, roi_dims, color=(255,0,0), thickness=2):
+        '''
+        ## Description
+        ---
+        Adds rectangle given as [x, y, w, h] (e.g. `Camera.roi_dims`)
+
+        ## Arguments
+        ---
+
+        | Argument  | Type            | Description                 | Default Value  |
+        | :------   | :--             | :---------                  | :-----------   |
+        | roi_dims  | `list` of `int` | Rectangle as [x, y, w, h]   | N/A            |
+        | color     | `tuple`         | *Optional:* BGR color       | (255,0,0)      |
+        | thickness | `int`           | *Optional:* Line thickness  | 2              |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        void
+        '''
+        x, y, w, h = roi_dims
+        pts = np.array([[[x, y], [x+w, y], [x+w, y+h], [x, y+h]]], dtype=float)
+        self._add_polylines(pts, color, thickness, True)
+
+    def add_circle(self, center, r, color=(0,255,255), thickness=-1):
+        '''
+        ## Description
+        ---
+        Adds circle (filled if `thickness` is -1)
+
+        ## Arguments
+        ---
+
+        | Argument  | Type       | Description                 | Default Value  |
+        | :------   | :--        | :---------                  | :-----------   |
+        | center    | `np.array` | (x, y) center of circle     | N/A            |
+        | r         | `int`      | Radius of circle in pixels  | N/A            |
+        | color     | `tuple`    | *Optional:* BGR color       | (0,255,255)    |
+        | thickness | `int`      | *Optional:* Line thickness  | -1             |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        void
+        '''
+        self.circles.append((np.asarray(center, dtype=float), r, color, thickness))
+
+    def _add_polylines(self, pts, color, thickness, closed):
+        '''
+        adds (n, k, 2) array of polylines to group with same color, thickness and closed flag
+        '''
+        key = (tuple(color), thickness, closed)
+        self.polylines.setdefault(key, []).append(pts)
+
+    def render(self, frame, scale=1.):
+        '''
+        ## Description
+        ---
+        Draws all primitives onto `frame` in place
+
+        ## Arguments
+        ---
+
+        | Argument| Type         | Description                                                            | Default Value  |
+        | :------ | :--          | :---------                                                             | :-----------   |
+        | frame   | `np.array`   | Frame to draw on                                                       | N/A            |
+        | scale   | `float`      | *Optional:* Scale of `frame` relative to tracking coordinates (for reduced resolution frames) | 1. |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `np.array` frame drawn on
+        '''
+        for (color, thickness, closed), pts in self.polylines.items():
+            pts = np.concatenate(pts, axis=0) if len(pts) > 1 else pts[0]
+            pts = np.rint(pts*scale).astype(np.int32)
+            cv2.polylines(frame, list(pts), closed, color, thickness)
+        for center, r, color, thickness in self.circles:
+            center = np.rint(center*scale).astype(int)
+            cv2.circle(frame, (int(center[0]), int(center[1])), max(int(round(r*scale)), 1), color, thickness)
+        return frame
@@ -0,0 +1,185 @@
+#scheduler.py
+# Frame budget scheduler for degrading tracking quality gracefully under overload
+
+# settings at full quality
+FULL_QUALITY = {
+    # skip drawing overlays and writing video
+    'skip_drawing': False,
+    # factor to shrink the roi (search window) by
+    'roi_scale': 1.,
+    # factor to downscale frame by before detection
+    'decimation': 1,
+    # number of subsets of tags detected in rotation, one subset per frame, each tag in a
+    # small search window around its last position
+    'tag_subsets': 1,
+}
+
+# degradation levels, from full quality to most degraded; each level only lists settings
+# that differ from FULL_QUALITY
+DEGRADATION_LEVELS = [
+    {},
+    {'skip_drawing': True},
+    {'skip_drawing': True, 'roi_scale': 0.8},
+    {'skip_drawing': True, 'roi_scale': 0.8, 'decimation': 2},
+    {'skip_drawing': True, 'roi_scale': 0.8, 'decimation': 2, 'tag_subsets': 2},
+    {'skip_drawing': True, 'roi_scale': 0.6, 'decimation': 3, 'tag_subsets': 3},
+]
+
+
+class FrameScheduler(object):
+    '''
+    ## Description
+    ---
+    Keeps the per frame time of the tracking loop within a target period by stepping through
+    `levels` of degradation. The frame time is the processing time of the frame, from detection
+    to saved state (not the absolute capture-to-state latency, as the capture pipeline of a camera
+    alone can take longer than a frame period). It is smoothed with an exponential moving average; one level is added as soon
+    as it is over budget (at most every `cooldown` frames), and one level is restored after it has
+    stayed under `restore_fraction` of the budget for `restore_frames` frames.
+
+    **Public Attributes (for the user):**
+
+    * **level**: index of current degradation level (0 is full quality)
+    * **frame_time**: smoothed frame time (s)
+    * **skip_drawing**, **roi_scale**, **decimation**, **tag_subsets**: active settings, see `FULL_QUALITY`
+    * **min_roi_factor**: min roi side as a multiple of the diameter of the tracked tags, see `roi_side`
+    '''
+
+    def __init__(self, target_period, levels=None, restore_fraction=0.7, restore_frames=30,\
+        cooldown=5, alpha=0.2, window_margin=100, min_roi_factor=1.2):
+        '''
+        ## Arguments
+        ---
+
+        | Argument         | Type            | Description                                                      | Default Value        |
+        | :------          | :--             | :---------                                                       | :-----------         |
+        | target_period    | `float`         | Frame time budget (s), e.g. 1/fps                                | N/A                  |
+        | levels           | `list` of `dict`| *Optional:* Degradation levels                                   | `DEGRADATION_LEVELS` |
+        | restore_fraction | `float`         | *Optional:* Fraction of budget under which quality is restored   | 0.7                  |
+        | restore_frames   | `int`           | *Optional:* Frames under budget before restoring one level       | 30                   |
+        | cooldown         | `int`           | *Optional:* Min frames between adding levels                     | 5                    |
+        | alpha            | `float`         | *Optional:* Smoothing factor of frame time                       | 0.2                  |
+        | window_margin    | `int`           | *Optional:* Half side (pixels) of search window around each tag  | 100                  |
+        | min_roi_factor   | `float`         | *Optional:* Min roi side as multiple of diameter of tracked tags | 1.2                  |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        '''
+        self.target_period = target_period
+        self.levels = DEGRADATION_LEVELS if levels is None else levels
+        self.restore_fraction = restore_fraction
+        self.restore_frames = restore_frames
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.window_margin = window_margin
+        self.min_roi_factor = min_roi_factor
+        self.frame_time = None
+        self.frame_count = 0
+        self._set_level(0)
+
+        # attributes to be used within class (Private)
+        self._frames_since_change = 0
+        self._frames_under_budget = 0
+
+    def _set_level(self, level):
+        '''
+        sets degradation level and its settings as attributes
+        '''
+        self.level = level
+        settings = dict(FULL_QUALITY, **self.levels[level])
+        for key, value in settings.items():
+            setattr(self, key, value)
+
+    def update(self, frame_time):
+        '''
+        ## Description
+        ---
+        Records time of most recent frame and adjusts degradation level
+
+        ## Arguments
+        ---
+
+        | Argument   | Type    | Description                  | Default Value  |
+        | :------    | :--     | :---------                   | :-----------   |
+        | frame_time | `float` | Time of most recent frame (s)| N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `int` degradation level
+        '''
+        self.frame_count += 1
+        self._frames_since_change += 1
+        if self.frame_time is None:
+            self.frame_time = frame_time
+        else:
+            self.frame_time += self.alpha*(frame_time-self.frame_time)
+
+        if self.frame_time > self.target_period:
+            self._frames_under_budget = 0
+            if self.level < len(self.levels)-1 and self._frames_since_change >= self.cooldown:
+                self._set_level(self.level+1)
+                self._frames_since_change = 0
+        elif self.frame_time < self.restore_fraction*self.target_period:
+            self._frames_under_budget += 1
+            if self.level > 0 and self._frames_under_budget >= self.restore_frames:
+                self._set_level(self.level-1)
+                self._frames_since_change = 0
+                self._frames_under_budget = 0
+        else:
+            self._frames_under_budget = 0
+        return self.level
+
+    def active_degradations(self):
+        '''
+        ## Description
+        ---
+        Returns settings of current level that differ from full quality
+
+        ## Returns
+        ---
+        `dict`
+        '''
+        return {key: getattr(self, key) for key in FULL_QUALITY\
+            if getattr(self, key) != FULL_QUALITY[key]}
+
+    def tag_subset(self, n_tags):
+        '''
+        ## Description
+        ---
+        Returns indices of tags to detect in current frame, rotating through `tag_subsets` subsets
+
+        ## Arguments
+        ---
+
+        | Argument | Type  | Description            | Default Value  |
+        | :------  | :--   | :---------             | :-----------   |
+        | n_tags   | `int` | Number of tracked tags | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `range` of tag indices
+        '''
+        return range(self.frame_count % self.tag_subsets, n_tags, self.tag_subsets)
+
+    def roi_side(self, side, extent):
+        '''
+        ## Description
+        ---
+        Returns roi side shrunk by `roi_scale`, but never smaller than `min_roi_factor` times the
+        diameter of the tags the roi follows, so shrinking never crops them out
+
+        ## Arguments
+        ---
+
+        | Argument | Type    | Description                                                        | Default Value  |
+        | :------  | :--     | :---------                                                         | :-----------   |
+        | side     | `float` | Roi side at full quality                                           | N/A            |
+        | extent   | `float` | Max distance of tags from roi center, in units of `side` (e.g. `TrackingGroup.extent`) | N/A |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `float` roi side
+        '''
+        return max(side*self.roi_scale, min(side, 2*self.min_roi_factor*extent))
@@ -6,9 +6,13 @@
 import numpy as np
 import cv2
 from copy import deepcopy
-from apriltag import *
+from collections import deque
+import os
 import time
-from tracking_object import TrackingObject
+from .tracking_object import TrackingObject
+from .tracking_group import TrackingGroup
+from .overlay import Overlay
+from .scheduler import FrameScheduler
 
 
 ################################################################################
@@ -24,7 +28,8 @@ class Tracking(object):
     '''
 
 
-    def __init__(self, tag_ids, history_len=None, length_dict=None):
+    def __init__(self, tag_ids, history_len=None, length_dict=None, groups=None, calibration=None,\
+        target_period=None):
         '''
 
         ## Arguments
@@ -41,6 +46,9 @@ class Tracking(object):
         | show_video   | `bool`          | *Optional:* Show video to screen if `True`                                              | `False`        |
         | history_len  | `int`           | *Optional:* Max length of tracking history to be saved                                  | `None`         |
         | roi_dims     | `list` of `int` | *Optional:* Two element list that specifies offset from detection frame to global frame | `None`         |
+        | groups       | `dict`          | *Optional:* Groups of tags to track collective state of, as {name: `list` of tag IDs}    | `None`         |
+        | calibration  | `Calibration`   | *Optional:* Maps detected points to world units, states are then in world units         | `None`         |
+        | target_period| `float`         | *Optional:* Frame time budget (s); degrades tracking to stay in it, see `FrameScheduler` | `None`         |
         |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
 
         '''
@@ -61,13 +69,39 @@ class Tracking(object):
              "length_dict should be a dictionary of same length of tag_ids"
             self.length_dict = length_dict
 
-        # April Tag Detector Object, specify tag family
-        self.detector = apriltag("tagStandard41h12")
+        # April Tag Detector Object, created on first detection (see _init_detector) so
+        # detections can be saved (e.g. replayed) without the AprilTag binding
+        self.detector = None
 
         # initialize tracking objects
         self.tracking_objects = [TrackingObject(tag_id, history_length=self.history_len,\
             tag_length=self.length_dict[tag_id]) for tag_id in self.tag_ids]
 
+        # undistortion and pixel to world mapping applied to detected points
+        self.calibration = calibration
+
+        # adapts detection quality per frame to stay within target period
+        if target_period is None:
+            self.scheduler = None
+        else:
+            self.scheduler = FrameScheduler(target_period)
+        self._t_detect = None
+
+        # current state (x, y, theta) of all tracking objects, in order of tag_ids
+        self.states = np.zeros((len(self.tag_ids), 3))
+
+        # groups of tags whose collective state is updated every frame
+        self.groups = {}
+        if groups is not None:
+            for name, group_ids in groups.items():
+                self.add_group(name, group_ids)
+
+        # capture-to-state latency of each frame and frame sequence accounting
+        self.latency = deque(maxlen=self.history_len)
+        self.dropped_frames = 0
+        self.duplicate_frames = 0
+        self._last_seq = None
+
     @classmethod
     def q_pressed(self):
         '''
@@ -104,8 +138,8 @@ class Tracking(object):
 
         '''
 
-        # set t0 for tracking data
-        self.t0 = time.time()
+        # t0 for tracking data is capture time of first frame, so replayed recordings keep their times
+        self.t0 = None
 
         for obj in self.tracking_objects:
             det = None
@@ -113,6 +147,8 @@ class Tracking(object):
             while det is None:
                 # capture frame and region of interest, specified by crop region
                 cam.capture_frame()
+                if self.t0 is None:
+                    self.t0 = cam.t_capture
                 # detect april tags in frame
                 detections = self.detect_frame(cam.frame)
                 ids_detected = [x['id'] for x in detections]
@@ -120,18 +156,55 @@ class Tracking(object):
                     det = None
                 else:
                     det = detections[ids_detected.index(obj.id)]
+                    if self.calibration is not None:
+                        det = self.calibration.calibrate_detections([det], [0,0])[0]
                 if (time.time()-t_start)>5:
                     raise Exception('Tag {}  could not be found in frame'.format(obj.id))
 
-            obj.init_detection(time.time()-t_start,det)
+            # stamped with capture time of frame, on the same clock and origin as save_detections
+            obj.init_detection(cam.t_capture-self.t0,det)
             print('Tag {} detected in frame'.format(obj.id))
 
+        self.states = np.array([obj.x for obj in self.tracking_objects])
+        t = cam.t_capture-self.t0
+        for group in self.groups.values():
+            group.update(t, self.states)
+
+    def add_group(self, name, tag_ids):
+        '''
+        ## Description
+        ---
+        Adds group of tags (e.g. the tags on the ring) whose collective state (centroid, orientation,
+        spread and tag positions in group frame) is updated every frame, see `TrackingGroup`
+
+        ## Arguments
+        ---
+
+        | Argument     | Type            | Description                                   | Default Value  |
+        | :------      | :--             | :---------                                    | :-----------   |
+        | name         | `string`        | Name of group, key in `self.groups`           | N/A            |
+        | tag_ids      | `list` of `int` | IDs of tags in group                          | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `TrackingGroup`
+        '''
+        missing = [tag_id for tag_id in tag_ids if tag_id not in self.tag_ids]
+        assert len(missing) == 0, 'Group {} has tags that are not tracked: {}'.format(name, missing)
+        # tag_ids are sorted, so indices can be looked up by bisection
+        idx = np.searchsorted(self.tag_ids, tag_ids)
+        self.groups[name] = TrackingGroup(name, tag_ids, idx, history_length=self.history_len)
+        return self.groups[name]
+
 
-    def detect_frame(self,frame):
+    def detect_frame(self, frame, offset=None):
         '''
         ## Description
         ---
-        Returns state (x, y, theta) given detection and offset
+        Detects April tags in frame. If the scheduler is degrading quality, the frame is
+        downscaled by its `decimation` and/or only searched in a small window around each tag of
+        the rotating subset of tags; detections are returned in frame coordinates either way
 
         ## Arguments
         ---
@@ -139,30 +212,93 @@ class Tracking(object):
         | Argument| Type         | Description              | Default Value  |
         | :------ | :--          | :---------               | :-----------   |
         | frame     | `np.array` | Frame to detect tags in  | N/A            |
+        | offset  | `list` of `int`| *Optional:* Offset from detection frame to global frame, used to find search window | `None` |
         |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
 
         ## Returns
         ---
         `list` of `dict`s corresponding to each tag detected
         '''
-
-        # convert frame to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        self.detections = self.detector.detect(gray)
+        self._t_detect = time.monotonic()
+        if self.detector is None:
+            self._init_detector()
+        # convert frame to grayscale (`Camera.gray` and frames replayed from a raw frame archive already are)
+        if frame.ndim == 2:
+            self.gray = frame
+        else:
+            self.gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.scheduler is None or (self.scheduler.decimation == 1 and self.scheduler.tag_subsets == 1):
+            self.detections = self.detector.detect(self.gray)
+            return self.detections
+
+        # search windows as (x, y) corner in frame and window
+        if self.scheduler.tag_subsets == 1:
+            windows = [(0, 0, self.gray)]
+        else:
+            if offset is None:
+                offset = [0,0]
+            subset = list(self.scheduler.tag_subset(len(self.tag_ids)))
+            pts = self.to_pixel(self.states[subset,:2])-np.asarray(offset)
+            margin = self.scheduler.window_margin
+            windows = []
+            # square window around last position of each tag in subset
+            for x0, y0, x1, y1 in np.hstack([np.floor(pts-margin), np.ceil(pts+margin)]).astype(int):
+                x0, y0, x1, y1 = max(x0, 0), max(y0, 0), max(x1, 0), max(y1, 0)
+                window = self.gray[y0:y1, x0:x1]
+                if window.size > 0:
+                    windows.append((x0, y0, window))
+        d = self.scheduler.decimation
+        self.detections = []
+        ids_detected = set()
+        for x0, y0, window in windows:
+            if d > 1:
+                window = cv2.resize(window, None, fx=1./d, fy=1./d, interpolation=cv2.INTER_AREA)
+            for det in self.detector.detect(window):
+                # windows of nearby tags overlap, keep first detection of each tag
+                if det['id'] not in ids_detected:
+                    ids_detected.add(det['id'])
+                    self.detections.append(self._rescale_detection(det, d, x0, y0))
         return self.detections
 
-    def save_detections(self, detections=None, offset=None):
+    def _init_detector(self):
+        '''
+        creates April Tag detector, specify tag family
+        '''
+        from apriltag import apriltag
+        self.detector = apriltag("tagStandard41h12")
+
+    @staticmethod
+    def _rescale_detection(det, d, x0, y0):
+        '''
+        maps detection in window decimated by d with corner (x0, y0) back to frame coordinates
+        '''
+        det = dict(det)
+        corner = np.array([x0, y0], dtype=float)
+        # pixel centers of decimated image are at (x+0.5)*d-0.5 in full image
+        det['center'] = (np.asarray(det['center'], dtype=float)+0.5)*d-0.5+corner
+        det['lb-rb-rt-lt'] = (np.asarray(det['lb-rb-rt-lt'], dtype=float)+0.5)*d-0.5+corner
+        return det
+
+    def save_detections(self, detections=None, offset=None, t_capture=None, seq=None, t_arrival=None):
         '''
         ## Description
         ---
-        Saves detection data to TrackingObject data class objects
+        Saves detection data to TrackingObject data class objects. If the capture stamp of the
+        frame is given (`Camera.t_capture`, `Camera.seq`), samples are timestamped with the capture
+        time, and capture-to-state latency and dropped/duplicate frames are recorded. Latency is
+        measured from `t_arrival` if given (`Camera.t_arrival`, e.g. for video files and frames
+        replayed from a raw frame archive, whose `t_capture` is the recorded time)
 
         ## Arguments
         ---
 
-        | Argument       | Type             | Description                    | Default Value  |
-        | :------        | :--              | :---------                     | :-----------   |
-        | detections     | `list` of `dict` | List of detection dictionaries | N/A            |
+        | Argument       | Type             | Description                                          | Default Value  |
+        | :------        | :--              | :---------                                           | :-----------   |
+        | detections     | `list` of `dict` | List of detection dictionaries                       | N/A            |
+        | offset         | `list` of `int`  | *Optional:* Offset from detection frame to global frame | `None`      |
+        | t_capture      | `float`          | *Optional:* Monotonic capture time of frame          | `None`         |
+        | seq            | `int`            | *Optional:* Sequence number of frame                 | `None`         |
+        | t_arrival      | `float`          | *Optional:* Monotonic time to measure latency from   | `t_capture`    |
         |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
 
         ## Returns
@@ -173,14 +309,81 @@ class Tracking(object):
             detections = self.detections
         if offset is None:
             offset = [0,0]
-        t= time.time()-self.t0
+        if seq is not None:
+            self._count_frames(seq)
+        if self.calibration is not None:
+            # map only detected points of this frame to world units, offset included
+            detections = self.calibration.calibrate_detections(detections, offset)
+            offset = [0,0]
+        if t_capture is None:
+            t = time.monotonic()-self.t0
+        else:
+            t = t_capture-self.t0
         ids_detected = [x['id']for x in detections]
-        for obj in self.tracking_objects:
+        for i, obj in enumerate(self.tracking_objects):
             # if id not detected in this frame
             if obj.id not in ids_detected:
                 obj.add_timestep(t, det = None, offset = offset)
             else:
                 obj.add_timestep(t, det = detections[ids_detected.index(obj.id)], offset = offset)
+                self.states[i] = obj.x
+        for group in self.groups.values():
+            group.update(t, self.states)
+        if t_arrival is None:
+            t_arrival = t_capture
+        if t_arrival is not None:
+            self.latency.append(time.monotonic()-t_arrival)
+        if self.scheduler is not None and self._t_detect is not None:
+            # processing time of frame; absolute latency includes the camera's own capture
+            # pipeline, which can exceed a frame period without any processing load
+            self.scheduler.update(time.monotonic()-self._t_detect)
+
+    def degradations(self):
+        '''
+        ## Description
+        ---
+        Returns degradations the scheduler currently has active (e.g. `{'skip_drawing': True, 'decimation': 2}`)
+
+        ## Returns
+        ---
+        `dict`, empty at full quality or without `target_period`
+        '''
+        if self.scheduler is None:
+            return {}
+        return self.scheduler.active_degradations()
+
+    def _count_frames(self, seq):
+        '''
+        Updates dropped and duplicate frame counts given sequence number of new frame
+        '''
+        if self._last_seq is not None:
+            if seq <= self._last_seq:
+                self.duplicate_frames += 1
+                return
+            self.dropped_frames += seq-self._last_seq-1
+        self._last_seq = seq
+
+    def latency_stats(self):
+        '''
+        ## Description
+        ---
+        Summarizes capture-to-state latency (s) of the frames passed to `save_detections` with
+        `t_capture`, along with dropped and duplicate frame counts
+
+        ## Returns
+        ---
+        `dict` with keys `count`, `mean`, `p50`, `p90`, `p99`, `max`, `dropped`, `duplicated`
+        '''
+        stats = {'count': len(self.latency), 'dropped': self.dropped_frames,\
+            'duplicated': self.duplicate_frames}
+        if len(self.latency) == 0:
+            stats.update(dict.fromkeys(['mean', 'p50', 'p90', 'p99', 'max']))
+            return stats
+        latency = np.array(self.latency)
+        p50, p90, p99 = np.percentile(latency, [50, 90, 99])
+        stats.update({'mean': latency.mean(), 'p50': p50, 'p90': p90, 'p99': p99,\
+            'max': latency.max()})
+        return stats
 
     def draw_lines(self, frame, ids):
         '''
@@ -201,18 +404,65 @@ class Tracking(object):
         ---
         `None`
         '''
-        for obj in self.tracking_objects:
-            if obj.id in ids:
-                # draw line showing orientation of tag
-                cv2.line(frame, (int(obj.x[0]),int(obj.x[1])),\
-                (int(obj.x[0]+self.line_length*np.cos(obj.x[2])), int(obj.x[1]+self.line_length*np.sin(obj.x[2]))),\
-                (0,255,0),2)
+        overlay = Overlay()
+        self.overlay_lines(overlay, ids)
+        overlay.render(frame)
+
+    def overlay_lines(self, overlay, ids):
+        '''
+        ## Description
+        ---
+        Adds lines showing orientation of tags to an `Overlay` (e.g. `Camera.overlay`), which
+        draws them in one batched pass only if the frame is shown or written
+
+        ## Arguments
+        ---
+
+        | Argument| Type         | Description              | Default Value  |
+        | :------ | :--          | :---------               | :-----------   |
+        | overlay | `Overlay`    | Overlay to add lines to  | N/A            |
+        | ids     | `np.array` | List of tag IDs for wich to draw lines  | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `None`
+        '''
+        selected = np.isin(self.tag_ids, ids)
+        if not np.any(selected):
+            return
+        X = self.states[selected]
+        end = X[:,:2]+self.line_length*np.stack([np.cos(X[:,2]), np.sin(X[:,2])], axis=1)
+        overlay.add_lines(self.to_pixel(X[:,:2]), self.to_pixel(end), (0,255,0), 2)
+
+    def to_pixel(self, pts):
+        '''
+        ## Description
+        ---
+        Maps points in state coordinates to pixel coordinates of the frame (identity without calibration)
+
+        ## Arguments
+        ---
+
+        | Argument| Type         | Description                            | Default Value  |
+        | :------ | :--          | :---------                             | :-----------   |
+        | pts     | `np.array`   | (n, 2) points in state coordinates     | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `np.array` (n, 2) points in pixel coordinates
+        '''
+        if self.calibration is None:
+            return pts
+        return self.calibration.to_pixel(pts)
 
     def get_centroid(self, tag_ids):
         '''
         ## Description
         ---
-        Gets centroid of specified tags
+        Gets centroid of specified tags. For groups added with `add_group`, the centroid is
+        already kept up to date in `self.groups[name].centroid`
 
         ## Arguments
         ---
@@ -227,13 +477,33 @@ class Tracking(object):
         ---
         `np.array`
         '''
-        ring_tag_xy = [obj.x[:2] for obj in self.tracking_objects if obj.id in tag_ids]
-        return sum(ring_tag_xy)/len(ring_tag_xy)
+        return self.states[np.isin(self.tag_ids, tag_ids),:2].mean(axis=0)
 
+    def get_extent(self, tag_ids):
+        '''
+        ## Description
+        ---
+        Gets max distance of specified tags from their centroid, e.g. to keep them inside the roi.
+        For groups added with `add_group`, it is kept up to date in `self.groups[name].extent`
+
+        ## Arguments
+        ---
+
+        | Argument| Type         | Description              | Default Value  |
+        | :------ | :--          | :---------               | :-----------   |
+        | tag_ids     | `np.array` | List of tag IDs  | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        `float`
+        '''
+        pts = self.states[np.isin(self.tag_ids, tag_ids),:2]
+        return np.sqrt(np.max(np.sum((pts-pts.mean(axis=0))**2, axis=1)))
 
     def get_scale_factor(self):
         '''
-        Get scale factor (mm/pixels) of camera setup
+        Get scale factor (pixels/mm, or world units/mm if `calibration` is given) of camera setup
         '''
         scale_factors = [obj.scale_factor for obj in self.tracking_objects if obj.tag_length is not None]
         # scale_factors = [obj.scale_factor for obj in objects_w_tag_length]
@@ -272,3 +542,49 @@ class Tracking(object):
 
         if local_copy:
             return t,S
+
+    def get_trajectory(self):
+        '''
+        ## Description
+        ---
+        Stacks the tracking history of all tracking objects into a trajectory tensor
+
+        ## Returns
+        ---
+        `np.array` of timestamps with shape (T,)
+        `np.array` of states (x, y, theta) with shape (T, N, 3), ordered as `tag_ids`
+        `np.array` of `bool` with shape (T, N) that is `False` for missed detections
+        '''
+        t = np.array(self.tracking_objects[0].t_history)
+        X = np.stack([np.array(obj.history) for obj in self.tracking_objects], axis=1)
+        mask = np.stack([np.array(obj.detected_history, dtype=bool) for obj in self.tracking_objects], axis=1)
+        return t, X, mask
+
+    def save_trajectory(self, path):
+        '''
+        ## Description
+        ---
+        Saves trajectory tensor to directory `path` as `t.npy`, `x.npy`, `mask.npy` and `ids.npy`
+        so that it can be loaded memory-mapped with `analytics.load_trajectory`. The history of
+        (x, y, orientation, spread) of each group is saved as `group_<name>.npy`
+
+        ## Arguments
+        ---
+
+        | Argument   | Type     | Description                                | Default Value  |
+        | :------    | :--      | :---------                                 | :-----------   |
+        | path       | `string` | Directory to save trajectory to            | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        void
+        '''
+        t, X, mask = self.get_trajectory()
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 't.npy'), t)
+        np.save(os.path.join(path, 'x.npy'), X)
+        np.save(os.path.join(path, 'mask.npy'), mask)
+        np.save(os.path.join(path, 'ids.npy'), np.array(self.tag_ids))
+        for name, group in self.groups.items():
+            np.save(os.path.join(path, 'group_{}.npy'.format(name)), np.array(group.history))
@@ -0,0 +1,109 @@
+#tracking_group.py
+# Collective state of groups of April tags (e.g. ring, swarm)
+
+import numpy as np
+from collections import deque
+
+from .analytics import mean_rotation
+
+
+################################################################################
+#                                  TrackingGroup Class                         #
+################################################################################
+
+class TrackingGroup(object):
+    '''
+    ## Description
+    ---
+    This class is a data struct for a group of April Tags (e.g. the tags on the ring, or all
+    smarticles) to store its current collective state as well as a timestamped history. The
+    group holds the indices of its tags in the state array of `Tracking`, so each update is
+    vectorized work over the group instead of a scan over all tracking objects.
+
+    **Public Attributes (for the user):**
+
+    * **name**: name of group (e.g. 'ring')
+    * **tag_ids**: April Tag IDs of tags in group
+    * **idx**: indices of tags in `Tracking.tag_ids` (and `Tracking.states`)
+    * **centroid**: (x, y) centroid of tags
+    * **orientation**: circular mean of the rotation of each tag since the first update, recorded with no discontinuities
+    * **spread**: root mean square distance of tags from centroid
+    * **extent**: max distance of tags from centroid
+    * **local**: (x, y) positions of tags in group frame (origin at centroid, rotated by orientation)
+    * **t**: time of most recent update
+    * **history**: history of (x, y, orientation, spread) of group
+    * **local_history**: history of positions of tags in group frame
+    * **t_history**: history of update times
+    '''
+
+    def __init__(self, name, tag_ids, idx, history_length=None):
+        '''
+        ## Arguments
+        ---
+
+        | Argument         | Type            | Description                                      | Default Value  |
+        | :------          | :--             | :---------                                       | :-----------   |
+        | name             | `string`        | Name of group                                    | N/A            |
+        | tag_ids          | `list` of `int` | IDs of April Tags in group                       | N/A            |
+        | idx              | `np.array`      | Indices of tags in state array of `Tracking`     | N/A            |
+        | history_length   | `int`           | Optional max history length to record            | `None`         |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        '''
+        self.name = name
+        self.tag_ids = list(tag_ids)
+        self.idx = np.asarray(idx, dtype=int)
+        self.centroid = np.zeros(2)
+        self.orientation = 0.
+        self.spread = 0.
+        self.extent = 0.
+        self.local = np.zeros((len(self.idx), 2))
+        self.t = 0
+        self.history = deque(maxlen=history_length)
+        self.local_history = deque(maxlen=history_length)
+        self.t_history = deque(maxlen=history_length)
+
+        # attributes to be used within class (Private)
+        # theta of each tag at first update, orientation is measured relative to it
+        self._theta0 = None
+
+    def update(self, t, states):
+        '''
+        ## Description
+        ---
+        Updates collective state of group from state array of all tags and adds it to history
+
+        ## Arguments
+        ---
+
+        | Argument| Type           | Description                                       | Default Value  |
+        | :------ | :--            | :---------                                        | :-----------   |
+        | t       | `float`        | Time of update                                    | N/A            |
+        | states  | `np.array`     | (N, 3) states (x, y, theta) of all tracked tags   | N/A            |
+        |<img width=300/>|<img width=300/>|<img width=900/>|<img width=250/>|
+
+        ## Returns
+        ---
+        void
+        '''
+        X = states[self.idx]
+        self.centroid = X[:,:2].mean(axis=0)
+        if self._theta0 is None:
+            self._theta0 = X[:,2].copy()
+        orientation = mean_rotation(X[:,2], self._theta0)
+        if len(self.t_history) > 0:
+            # record angle so that there are no discontinuities (as in TrackingObject._get_state)
+            dtheta = np.mod(np.pi+orientation-self.orientation, 2*np.pi)-np.pi
+            orientation = self.orientation+dtheta
+        self.orientation = orientation
+        rel = X[:,:2]-self.centroid
+        dist2 = np.sum(rel**2, axis=1)
+        self.spread = np.sqrt(np.mean(dist2))
+        self.extent = np.sqrt(np.max(dist2))
+        c, s = np.cos(self.orientation), np.sin(self.orientation)
+        # rotate by -orientation into group frame
+        self.local = np.stack([c*rel[:,0]+s*rel[:,1], -s*rel[:,0]+c*rel[:,1]], axis=1)
+        self.t = t
+        self.history.append(np.array([self.centroid[0], self.centroid[1], self.orientation, self.spread]))
+        self.local_history.append(self.local)
+        self.t_history.append(self.t)
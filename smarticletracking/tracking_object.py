@@ -27,6 +27,7 @@ class TrackingObject(object):
     * **t**: time of most recent detection of tag
     * **history**: history of states (x,y, theta) of tag
     * **t_history**: history of detection times of tag
+    * **detected_history**: history of flags that are `True` where the tag was detected and `False` where the state was carried over or interpolated
 
     **Private Attributes (for the class):**
 
@@ -58,6 +59,7 @@ class TrackingObject(object):
         # set a max length specified by input
         self.history = deque(maxlen=history_length)
         self.t_history = deque(maxlen=history_length)
+        self.detected_history = deque(maxlen=history_length)
         self.scale_factor = None
 
         # attributes to be used within class (Private)
@@ -134,8 +136,9 @@ class TrackingObject(object):
         while self._missed_frames > 0:
             # calculate dt between missed frame and t0
             dt = self.t_history[-(self._missed_frames)] - t0
-            # apply linear smoothing
-            self.history[-(self._missed_frames)] += m*dt
+            # apply linear smoothing (not in place: missed frames share the array of the
+            # last detected state)
+            self.history[-(self._missed_frames)] = self.history[-(self._missed_frames)]+m*dt
             # move to next missed frame
             self._missed_frames-=1
 
@@ -169,6 +172,7 @@ class TrackingObject(object):
         # add initial pose and time to history
         self.t_history.append(self.t)
         self.history.append(self.x)
+        self.detected_history.append(True)
         # set detection flag to true
         self._object_detected = True
 
@@ -211,3 +215,4 @@ class TrackingObject(object):
             # add most recent time step to history
         self.history.append(self.x)
         self.t_history.append(self.t)
+        self.detected_history.append(det is not None)